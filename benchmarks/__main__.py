@@ -0,0 +1,125 @@
+import argparse
+import fnmatch
+import sys
+import tempfile
+
+from . import corpus, memory, suite
+
+
+def main(argv=None):
+    """Command line interface of the benchmark suite"""
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark the conversion of a generated corpus of notebooks to docx.',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument(
+        '-o', '--output',
+        help='JSON file of the results, by default they are only printed',
+    )
+    run_parser.add_argument(
+        '--corpus-dir',
+        help='Directory of the generated notebooks, by default a temporary directory',
+    )
+    run_parser.add_argument(
+        '-b', '--benchmark',
+        action='append',
+        choices=['import'] + list(suite.BENCHMARKS),
+        help='Benchmark to run, can be given several times, by default all benchmarks run',
+    )
+    run_parser.add_argument(
+        '-c', '--case',
+        action='append',
+        help='Case of the corpus or glob-pattern of cases, can be given several times',
+    )
+    run_parser.add_argument(
+        '--quick',
+        action='store_true',
+        help='Run only the small cases of the corpus',
+    )
+    run_parser.add_argument(
+        '-r', '--repeat',
+        type=int,
+        default=5,
+        help='Number of measured runs of every benchmark (default 5)',
+    )
+    run_parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the generated notebooks (default 0)',
+    )
+
+    memory_parser = subparsers.add_parser(
+        'memory', help='Measure the memory of exports of notebooks from 1 MB to 500 MB',
+    )
+    memory_parser.add_argument(
+        '-o', '--output',
+        help='JSON file of the results, by default they are only printed',
+    )
+    memory_parser.add_argument(
+        '--corpus-dir',
+        help='Directory of the generated notebooks, by default a temporary directory',
+    )
+    memory_parser.add_argument(
+        '-c', '--case',
+        action='append',
+        help='Case of the corpus or glob-pattern of cases, can be given several times',
+    )
+    memory_parser.add_argument(
+        '--quick',
+        action='store_true',
+        help='Measure only the notebooks up to 10 MB',
+    )
+    memory_parser.add_argument(
+        '--budget',
+        help='Fail if the peak of the Python heap or the increase of the resident set size of an '
+             'export exceeds a multiple of the notebook size like 3x or a number of megabytes '
+             'like 500',
+    )
+    memory_parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the generated notebooks (default 0)',
+    )
+
+    compare_parser = subparsers.add_parser('compare', help='Compare the results of two runs')
+    compare_parser.add_argument('old', help='JSON file of the earlier run')
+    compare_parser.add_argument('new', help='JSON file of the later run')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        print(f'{"benchmark":<44} {"case":<24} {"old":>12} {"new":>12} {"ratio":>7}')
+        for benchmark, case, old, new, ratio in suite.compare(
+                suite.load(args.old), suite.load(args.new)):
+            print(f'{benchmark:<44} {case or "":<24} {old:>12.4g} {new:>12.4g} {ratio:>7.2f}')
+        return 0
+
+    if args.command == 'memory':
+        cases = corpus.QUICK_MEMORY_CORPUS if args.quick else list(corpus.MEMORY_CORPUS)
+    else:
+        cases = corpus.QUICK_CORPUS if args.quick else list(corpus.CORPUS)
+    if args.case:
+        cases = [
+            case for case in cases
+            if any(fnmatch.fnmatchcase(case, pattern) for pattern in args.case)
+        ]
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        paths = corpus.generate_corpus(args.corpus_dir or tempdir, cases=cases, seed=args.seed)
+        if args.command == 'memory':
+            results = memory.run(paths, budget=args.budget)
+        else:
+            results = suite.run(paths, benchmarks=args.benchmark, repeat=args.repeat)
+    results['metadata']['seed'] = args.seed
+    if args.output is not None:
+        suite.save(results, args.output)
+    return 1 if any(result.get('exceeded') for result in results['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import base64
+import json
+from pathlib import Path
+import random
+import struct
+import zlib
+
+import nbformat
+
+from jupyter_docx_bundler.tables import TABLE_SCHEMA_MIMETYPE
+
+# parameters of a notebook of the corpus, every case of the corpus scales one of them
+DEFAULT_PARAMS = {
+    'cells': 20,
+    'tables': 2,
+    'table_rows': 50,
+    'table_schema': False,
+    'images': 2,
+    'linked_images': 2,
+    'plotly_figures': 0,
+    'math_density': 1,
+}
+
+CORPUS = {
+    'default': {},
+    'cells-200': {'cells': 200},
+    'cells-2000': {'cells': 2000},
+    'cells-5000': {'cells': 5000},
+    'table-rows-1000': {'tables': 1, 'table_rows': 1000},
+    'table-rows-10000': {'tables': 1, 'table_rows': 10000},
+    'table-rows-10000-schema': {'tables': 1, 'table_rows': 10000, 'table_schema': True},
+    'tables-50': {'tables': 50},
+    'tables-50-schema': {'tables': 50, 'table_schema': True},
+    'images-20': {'images': 20},
+    'images-100': {'images': 100},
+    'linked-images-20': {'linked_images': 20},
+    'linked-images-100': {'linked_images': 100},
+    'plotly-1': {'plotly_figures': 1},
+    'plotly-10': {'plotly_figures': 10},
+    'math-0': {'math_density': 0},
+    'math-20': {'math_density': 20},
+    'math-200': {'math_density': 200},
+}
+
+# small cases, which cover every kind of content within a few seconds
+QUICK_CORPUS = ['default', 'table-rows-1000', 'images-20', 'linked-images-20', 'math-20']
+
+# notebooks of about 1 MB to 500 MB for measuring memory, most of their size are output images
+MEMORY_CORPUS = {
+    'size-1mb': {'cells': 10, 'images': 1},
+    'size-10mb': {'cells': 20, 'images': 8},
+    'size-100mb': {'cells': 100, 'images': 85},
+    'size-500mb': {'cells': 200, 'images': 425},
+}
+
+QUICK_MEMORY_CORPUS = ['size-1mb', 'size-10mb']
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut '
+    'labore et dolore magna aliqua'
+).split()
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + \
+        struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def png_image(width, height, seed=0):
+    """Generate a png image with random pixels, which compresses as badly as a photo
+
+    Parameters
+    ----------
+    width : int
+        Width of the image in pixels
+    height : int
+        Height of the image in pixels
+    seed : int, optional
+        Seed of the pixels, the same seed always gives the same image
+
+    Returns
+    -------
+    bytes
+        Raw data of the image
+
+    """
+    rng = random.Random(seed)
+    rows = [
+        b'\x00' + rng.getrandbits(width * 24).to_bytes(width * 3, 'little')
+        for _ in range(height)
+    ]
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(b''.join(rows))),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def _sentence(rng, formulas=0):
+    words = [rng.choice(WORDS) for _ in range(12)]
+    for _ in range(formulas):
+        # formulas with whitespace, which preprocess has to strip
+        position = rng.randrange(len(words))
+        if rng.random() < 0.2:
+            words[position] = f'\n\n$$ \\sum_{{i=1}}^{{n}} x_{position}^2 $$\n\n'
+        else:
+            words[position] = f'$ x_{position} + y^{rng.randrange(10)} $'
+    return ' '.join(words).capitalize() + '.'
+
+
+def _table_output(rng, rows, schema=False):
+    import pandas as pd
+
+    df = pd.DataFrame({
+        'name': [rng.choice(WORDS) for _ in range(rows)],
+        'count': [rng.randrange(1000) for _ in range(rows)],
+        'value': [round(rng.gauss(0, 1), 6) for _ in range(rows)],
+    })
+    data = {
+        'text/plain': df.to_string(max_rows=10),
+        'text/html': df.to_html(),
+    }
+    if schema:
+        # like a notebook run with the display option html.table_schema
+        with pd.option_context('display.html.table_schema', True):
+            data[TABLE_SCHEMA_MIMETYPE] = json.loads(json.dumps(df._repr_data_resource_()))
+    return nbformat.v4.new_output('execute_result', data, execution_count=1)
+
+
+def _plotly_output(rng, points=100):
+    figure = {
+        'data': [{
+            'type': 'scatter',
+            'mode': 'lines',
+            'x': list(range(points)),
+            'y': [round(rng.gauss(0, 1), 6) for _ in range(points)],
+        }],
+        'layout': {'width': 600, 'height': 400},
+    }
+    return nbformat.v4.new_output('display_data', {
+        'application/vnd.plotly.v1+json': figure,
+        'text/plain': 'Figure',
+    })
+
+
+def _spread(count, cells):
+    """Indexes of the cells, which get one of `count` items, several items per cell if needed"""
+    return [ii * cells // count for ii in range(count)] if cells > 0 else []
+
+
+def generate_notebook(directory, name='notebook', seed=0, **params):
+    """Generate a notebook with text, tables, images, plotly figures and formulas
+
+    The notebook consists of pairs of markdown and code cells. Tables, images and figures are
+    spread evenly over the cells. Linked images are written to the `images` directory next to
+    the notebook. The same parameters and seed always give the same notebook.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Directory of the notebook and its linked images
+    name : str, optional
+        Name of the notebook without extension
+    seed : int, optional
+        Seed of the content
+    **params
+        Parameters of the notebook, which replace `DEFAULT_PARAMS`:
+
+        * cells: number of pairs of markdown and code cells
+        * tables: number of pandas tables in outputs
+        * table_rows: number of rows of every table
+        * table_schema: whether tables have a table schema next to their HTML
+        * images: number of png images in outputs
+        * linked_images: number of png images linked in markdown cells
+        * plotly_figures: number of plotly figures in outputs
+        * math_density: number of formulas in every markdown cell
+
+    Returns
+    -------
+    nbformat.NotebookNode
+
+    """
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f'Unknown parameters: {", ".join(sorted(unknown))}')
+    params = dict(DEFAULT_PARAMS, **params)
+    rng = random.Random(seed)
+    directory = Path(directory)
+    (directory / 'images').mkdir(parents=True, exist_ok=True)
+
+    cells = params['cells']
+    tables = _spread(params['tables'], cells)
+    images = _spread(params['images'], cells)
+    linked_images = _spread(params['linked_images'], cells)
+    plotly_figures = _spread(params['plotly_figures'], cells)
+
+    nb = nbformat.v4.new_notebook()
+    nb.metadata['title'] = f'Benchmark {name}'
+    for ii in range(cells):
+        source = [f'## Section {ii}', _sentence(rng, params['math_density'])]
+        for jj in range(linked_images.count(ii)):
+            filename = f'{name}-{ii}-{jj}.png'
+            (directory / 'images' / filename).write_bytes(
+                png_image(320, 240, seed=rng.getrandbits(32)),
+            )
+            source.append(f'![Figure {ii}.{jj}](images/{filename})')
+        nb.cells.append(nbformat.v4.new_markdown_cell('\n\n'.join(source)))
+
+        outputs = [nbformat.v4.new_output('stream', name='stdout', text=_sentence(rng) + '\n')]
+        for _ in range(tables.count(ii)):
+            outputs.append(_table_output(rng, params['table_rows'], params['table_schema']))
+        for _ in range(images.count(ii)):
+            outputs.append(nbformat.v4.new_output('display_data', {
+                'image/png': base64.b64encode(
+                    png_image(640, 480, seed=rng.getrandbits(32)),
+                ).decode('ascii'),
+                'text/plain': '<Figure size 640x480 with 1 Axes>',
+            }))
+        for _ in range(plotly_figures.count(ii)):
+            outputs.append(_plotly_output(rng))
+        nb.cells.append(nbformat.v4.new_code_cell(f'result_{ii} = compute({ii})', outputs=outputs))
+
+    # cell ids are random otherwise
+    for ii, cell in enumerate(nb.cells):
+        cell['id'] = f'cell-{ii}'
+
+    nbformat.write(nb, f'{directory / name}.ipynb')
+    return nb
+
+
+def generate_corpus(directory, cases=None, seed=0):
+    """Generate the notebooks of the corpus
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Directory of the notebooks
+    cases : list of str, optional
+        Names of the cases in `CORPUS` or `MEMORY_CORPUS`, by default all cases of `CORPUS` are
+        generated
+    seed : int, optional
+        Seed of the content
+
+    Returns
+    -------
+    dict
+        Path of the notebook with the name of the case as key
+
+    """
+    paths = {}
+    for case in cases if cases is not None else CORPUS:
+        params = CORPUS[case] if case in CORPUS else MEMORY_CORPUS[case]
+        generate_notebook(directory, name=case, seed=seed, **params)
+        paths[case] = Path(directory) / f'{case}.ipynb'
+    return paths
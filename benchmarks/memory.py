@@ -0,0 +1,262 @@
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import gc
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+import nbformat
+
+# stages of an export, which are measured on their own, with the function running them
+STAGES = {
+    'copy': 'copy_notebook',
+    'preprocess': 'preprocess',
+    'serialize': 'notebook_chunks',
+    'pandoc': 'run_pandoc',
+}
+
+
+class StageTracker:
+    """Attribute the peak of the traced memory to the stages of an export
+
+    Stages can be nested, the peak is attributed to the innermost stage running at that time.
+    Everything outside of the stages is attributed to `export`. Requires Python 3.9 or later.
+    """
+
+    def __init__(self):
+        self.peaks = {}
+        self._stack = ['export']
+
+    def _mark(self):
+        name = self._stack[-1]
+        self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._mark()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._mark()
+            self._stack.pop()
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _wrap_generator(self, name, func):
+        def wrapper(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            while True:
+                with self.stage(name):
+                    item = next(iterator, StopIteration)
+                if item is StopIteration:
+                    return
+                yield item
+        return wrapper
+
+    @contextlib.contextmanager
+    def patch(self):
+        """Measure the stages of all exports within the context"""
+        from jupyter_docx_bundler import converters
+
+        with contextlib.ExitStack() as stack:
+            for name, function in STAGES.items():
+                func = getattr(converters, function)
+                wrap = self._wrap_generator if name == 'serialize' else self._wrap
+                stack.enter_context(mock.patch.object(converters, function, wrap(name, func)))
+            yield self
+
+    def finish(self):
+        self._mark()
+        return self.peaks
+
+
+def _reset_peak_rss():
+    # only Linux allows to reset the peak resident set size of a process
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    factor = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * factor
+
+
+def _children_peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    factor = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * factor
+
+
+def measure_export(path, trace=True):
+    """Measure the memory of the export of a notebook with `DocxExporter.from_notebook_node`
+
+    The notebook is read and the converters are imported before the measurement, so their memory
+    is not part of the result. The memory of the returned document is attributed to the `export`
+    stage.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the notebook
+    trace : bool, optional
+        Measure the peak of the Python heap with tracemalloc and attribute it to the stages of
+        the export, otherwise measure the peak resident set size of the process and of pandoc.
+        tracemalloc needs memory of its own, so both are measured in separate runs.
+
+    Returns
+    -------
+    dict
+
+    """
+    from jupyter_docx_bundler import DocxExporter
+    # the exporter imports the converters on its first export
+    import jupyter_docx_bundler.converters  # noqa: F401
+
+    path = Path(path)
+    nb = nbformat.read(f'{path}', as_version=4)
+    exporter = DocxExporter()
+    resources = {'metadata': {'name': path.stem, 'path': f'{path.parent}'}}
+    gc.collect()
+
+    if trace:
+        if not hasattr(tracemalloc, 'reset_peak'):
+            raise RuntimeError('Measuring the stages of an export requires Python 3.9 or later')
+        tracker = StageTracker()
+        tracemalloc.start()
+        try:
+            with tracker.patch():
+                exporter.from_notebook_node(nb, resources)
+            peaks = tracker.finish()
+        finally:
+            tracemalloc.stop()
+        return {
+            'peak_heap': max(peaks.values()),
+            'peak_stage': max(peaks, key=peaks.get),
+            'stages': peaks,
+        }
+
+    exact = _reset_peak_rss()
+    rss_before = _peak_rss()
+    start = time.perf_counter()
+    exporter.from_notebook_node(nb, resources)
+    duration = time.perf_counter() - start
+    peak_rss = _peak_rss()
+    return {
+        'duration': duration,
+        'peak_rss': peak_rss,
+        # without a reset the peak of the process can be reached before the export
+        'rss_increase': peak_rss - rss_before if peak_rss is not None else None,
+        'rss_exact': exact,
+        'pandoc_peak_rss': _children_peak_rss(),
+    }
+
+
+def _in_new_process(func, *args):
+    # a new interpreter for every measurement, so earlier exports do not change the peaks
+    with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+    ) as executor:
+        return executor.submit(func, *args).result()
+
+
+def parse_budget(budget):
+    """Parse a memory budget, a multiple of the notebook size like `3x` or megabytes like `500`
+
+    Returns
+    -------
+    tuple
+        Factor of the notebook size or None and number of bytes or None
+
+    """
+    budget = f'{budget}'.strip().lower()
+    if budget.endswith('x'):
+        return float(budget[:-1]), None
+    return None, int(float(budget) * 1024 ** 2)
+
+
+def run(paths, budget=None, log=print):
+    """Measure the memory of the export of the notebooks of the corpus
+
+    Every notebook is exported twice in new processes, once to measure the Python heap and its
+    stages and once to measure the resident set size.
+
+    Parameters
+    ----------
+    paths : dict
+        Path of the notebook with the name of the case as key
+    budget : str, optional
+        Maximum peak of the Python heap and maximum increase of the resident set size during an
+        export, see `parse_budget`
+    log : callable, optional
+        Called with a line of progress for every result
+
+    Returns
+    -------
+    dict
+        Metadata of the run and the results of all notebooks
+
+    """
+    from .corpus import CORPUS, DEFAULT_PARAMS, MEMORY_CORPUS
+    from .suite import metadata
+
+    factor, limit = parse_budget(budget) if budget is not None else (None, None)
+    results = []
+    for case, path in paths.items():
+        size = os.path.getsize(path)
+        result = {
+            'benchmark': 'memory',
+            'case': case,
+            'params': dict(DEFAULT_PARAMS, **{**CORPUS, **MEMORY_CORPUS}.get(case, {})),
+            'notebook_size': size,
+        }
+        result.update(_in_new_process(measure_export, path, True))
+        result.update(_in_new_process(measure_export, path, False))
+
+        if factor is not None:
+            limit = int(factor * size)
+        result['budget'] = limit
+        result['exceeded'] = limit is not None and (
+            result['peak_heap'] > limit or
+            result['rss_increase'] is not None and result['rss_increase'] > limit
+        )
+        results.append(result)
+
+        rss_increase = result['rss_increase'] / 1024 ** 2 \
+            if result['rss_increase'] is not None else float('nan')
+        log(
+            f'{case:<20} notebook {size / 1024 ** 2:8.1f} MB  '
+            f'heap {result["peak_heap"] / 1024 ** 2:8.1f} MB ({result["peak_stage"]:<10})  '
+            f'rss +{rss_increase:8.1f} MB'
+            f'{"  EXCEEDS BUDGET" if result["exceeded"] else ""}'
+        )
+
+    return {'metadata': metadata(), 'results': results}
@@ -0,0 +1,301 @@
+import copy
+from datetime import datetime, timezone
+from functools import partial
+import importlib.util
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import nbformat
+
+from jupyter_docx_bundler import converters
+from jupyter_docx_bundler.cache import package_version
+from jupyter_docx_bundler.tables import (
+    html_table_to_markdown, TABLE_SCHEMA_MIMETYPE, table_schema_to_markdown,
+)
+
+from .corpus import CORPUS, DEFAULT_PARAMS
+
+
+def _table_html(nb):
+    return [
+        output['data']['text/html']
+        for cell in nb.cells
+        for output in cell.get('outputs', [])
+        if converters._is_pandas_table(output)
+    ]
+
+
+def _table_schemas(nb):
+    return [
+        output['data'][TABLE_SCHEMA_MIMETYPE]
+        for cell in nb.cells
+        for output in cell.get('outputs', [])
+        if 'data' in output and TABLE_SCHEMA_MIMETYPE in output['data']
+    ]
+
+
+def _linked_image_cells(nb):
+    return [
+        cell for cell in nb.cells
+        if cell.cell_type == 'markdown' and converters.RE_IMAGE.search(cell.source)
+    ]
+
+
+def bench_preprocess(nb, path, name):
+    return lambda: None, lambda _: converters.preprocess(nb, path)
+
+
+def bench_html_to_pandas_table(nb, path, name):
+    tables = _table_html(nb)
+    if not tables:
+        return None
+    return lambda: None, lambda _: [converters.html_to_pandas_table(s) for s in tables]
+
+
+def bench_html_table_to_markdown(nb, path, name):
+    tables = _table_html(nb)
+    if not tables:
+        return None
+    return lambda: None, lambda _: [html_table_to_markdown(s) for s in tables]
+
+
+def bench_table_schema_to_markdown(nb, path, name):
+    resources = _table_schemas(nb)
+    if not resources:
+        return None
+    return lambda: None, lambda _: [table_schema_to_markdown(x) for x in resources]
+
+
+def bench_linked_to_attachment_image(nb, path, name):
+    cells = _linked_image_cells(nb)
+    if not cells:
+        return None
+
+    def run(cells):
+        encoded_images = {}
+        for cell in cells:
+            converters.linked_to_attachment_image(cell, path, encoded_images=encoded_images)
+
+    # the cells are changed, so every run gets its own copy
+    return lambda: copy.deepcopy(cells), run
+
+
+def bench_notebookcontent_to_docxbytes(nb, path, name, **kwargs):
+    def run(_):
+        converters.notebookcontent_to_docxbytes(nb, name, path, **kwargs)
+
+    return lambda: None, run
+
+
+# benchmarks of a single notebook, every benchmark returns a setup and a timed function, which is
+# called with the result of the setup, or None if it does not apply to the notebook
+BENCHMARKS = {
+    'preprocess': bench_preprocess,
+    'html_to_pandas_table': bench_html_to_pandas_table,
+    'html_table_to_markdown': bench_html_table_to_markdown,
+    'table_schema_to_markdown': bench_table_schema_to_markdown,
+    'linked_to_attachment_image': bench_linked_to_attachment_image,
+    'notebookcontent_to_docxbytes': bench_notebookcontent_to_docxbytes,
+    # variants of the pandoc filter and the io, which are compared to the default lua and pipe
+    'notebookcontent_to_docxbytes-python-filter': partial(
+        bench_notebookcontent_to_docxbytes, pandoc_filter='python',
+    ),
+    'notebookcontent_to_docxbytes-file-io': partial(
+        bench_notebookcontent_to_docxbytes, pandoc_io='file',
+    ),
+}
+
+
+def time_function(setup, func, repeat=5, warmup=1):
+    """Measure the wall-clock time of a function
+
+    Parameters
+    ----------
+    setup : callable
+        Called before every run, its result is passed to `func` and its duration is not measured
+    func : callable
+        Measured function
+    repeat : int, optional
+        Number of measured runs
+    warmup : int, optional
+        Number of runs before the measured runs, which start processes and fill caches
+
+    Returns
+    -------
+    list of float
+        Duration of every run in seconds
+
+    """
+    times = []
+    for ii in range(warmup + repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        if ii >= warmup:
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def time_import(repeat=5):
+    """Measure the import of jupyter_docx_bundler in new interpreters
+
+    Parameters
+    ----------
+    repeat : int, optional
+        Number of measured imports
+
+    Returns
+    -------
+    list of float
+        Duration of every import in seconds
+
+    """
+    code = (
+        'import time\n'
+        'start = time.perf_counter()\n'
+        'import jupyter_docx_bundler\n'
+        'print(time.perf_counter() - start)\n'
+    )
+    return [
+        float(subprocess.run(
+            [sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+        ).stdout)
+        for _ in range(repeat)
+    ]
+
+
+def _result(benchmark, case, times, **params):
+    return {
+        'benchmark': benchmark,
+        'case': case,
+        'params': params,
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        ).stdout.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    """Describe the environment of a benchmark run
+
+    Returns
+    -------
+    dict
+
+    """
+    import pypandoc
+
+    return {
+        'commit': _git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandoc': pypandoc.get_pandoc_version(),
+        'jupyter-docx-bundler': package_version(),
+    }
+
+
+def run(paths, benchmarks=None, repeat=5, warmup=1, log=print):
+    """Run the benchmarks on the notebooks of the corpus
+
+    Parameters
+    ----------
+    paths : dict
+        Path of the notebook with the name of the case as key
+    benchmarks : list of str, optional
+        Names of the benchmarks in `BENCHMARKS` or `import`, by default all benchmarks run
+    repeat : int, optional
+        Number of measured runs of every benchmark
+    warmup : int, optional
+        Number of runs before the measured runs
+    log : callable, optional
+        Called with a line of progress for every result
+
+    Returns
+    -------
+    dict
+        Metadata of the run and the results of all benchmarks
+
+    """
+    if benchmarks is None:
+        benchmarks = ['import'] + list(BENCHMARKS)
+    results = []
+
+    if 'import' in benchmarks:
+        results.append(_result('import', None, time_import(repeat)))
+        log(f'{"import":<44} {"":<24} {results[-1]["min"]:.4f} s')
+
+    kaleido = importlib.util.find_spec('kaleido') is not None
+    for case, path in paths.items():
+        params = dict(DEFAULT_PARAMS, **CORPUS.get(case, {}))
+        if params['plotly_figures'] > 0 and not kaleido:
+            log(f'Skip {case}, rendering plotly figures requires kaleido')
+            continue
+        nb = nbformat.read(f'{path}', as_version=4)
+        for benchmark in benchmarks:
+            if benchmark not in BENCHMARKS:
+                continue
+            functions = BENCHMARKS[benchmark](nb, f'{path.parent}', case)
+            if functions is None:
+                continue
+            times = time_function(*functions, repeat=repeat, warmup=warmup)
+            results.append(_result(benchmark, case, times, **params))
+            log(f'{benchmark:<44} {case:<24} {results[-1]["min"]:.4f} s')
+
+    return {'metadata': metadata(), 'results': results}
+
+
+def _metric(result):
+    # minimum duration of timings, peak of the Python heap of memory measurements
+    return result['min'] if 'min' in result else result['peak_heap']
+
+
+def compare(old, new):
+    """Compare the minimum durations or the peak memory of two benchmark runs
+
+    Parameters
+    ----------
+    old : dict
+        Results of the earlier run
+    new : dict
+        Results of the later run
+
+    Returns
+    -------
+    list of tuple
+        Benchmark, case, minimum durations or peaks of the Python heap of both runs and their
+        ratio for every result of both runs
+
+    """
+    old_results = {(x['benchmark'], x['case']): x for x in old['results']}
+    rows = []
+    for result in new['results']:
+        key = (result['benchmark'], result['case'])
+        if key in old_results:
+            old_value = _metric(old_results[key])
+            rows.append((*key, old_value, _metric(result), _metric(result) / old_value))
+    return rows
+
+
+def save(results, filename):
+    with open(filename, 'w', encoding='utf8') as file:
+        json.dump(results, file, indent=2)
+
+
+def load(filename):
+    with open(filename, encoding='utf8') as file:
+        return json.load(file)
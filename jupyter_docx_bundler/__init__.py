@@ -1,6 +1,25 @@
+import contextlib
+import os
+
 from nbconvert.exporters import Exporter
+from nbconvert.preprocessors import Preprocessor
+from traitlets import Bool, Enum, Float, Integer, Unicode
+
+from .cache import DiskCache, get_memory_cache
+from .profiling import get_profile_dir, PROFILE_DIR_ENV, profile_conversion
+from .report import ConversionReport
+
 
-from . import converters
+def _changes_notebook(preprocessor):
+    """Whether a preprocessor of nbconvert may change the notebook
+
+    Instances of `Preprocessor` only change the notebook if they are enabled. nbconvert calls
+    every other callable, like plain functions, regardless of an `enabled` attribute, so they
+    always may change it.
+    """
+    if isinstance(preprocessor, Preprocessor):
+        return preprocessor.enabled
+    return True
 
 
 class DocxExporter(Exporter):
@@ -10,15 +29,302 @@ class DocxExporter(Exporter):
 
     output_mimetype = 'application/docx'
 
+    plotly_workers = Integer(
+        1,
+        help='Number of plotly figures which are rendered at the same time. Every worker runs '
+             'its own kaleido process.',
+    ).tag(config=True)
+
+    plotly_cache_dir = Unicode(
+        None,
+        allow_none=True,
+        help='Directory of the cache for rendered plotly figures. No cache is used if unset.',
+    ).tag(config=True)
+
+    plotly_cache_size = Integer(
+        100 * 1024 ** 2,
+        help='Maximum size of the cache for rendered plotly figures in bytes.',
+    ).tag(config=True)
+
+    pandoc_filter = Enum(
+        ['lua', 'python'],
+        'lua',
+        help='Implementation of the pandoc filter which removes hidden inputs. The lua filter '
+             'runs inside of pandoc, the python filter in a separate Python interpreter.',
+    ).tag(config=True)
+
+    pandoc_backend = Enum(
+        ['subprocess', 'server'],
+        'subprocess',
+        help='Run pandoc as a new subprocess for every conversion or convert with a long-lived '
+             'pandoc server, which requires pandoc 2.18 or later. If the server is not '
+             'available, a subprocess is used.',
+    ).tag(config=True)
+
+    pandoc_io = Enum(
+        ['pipe', 'file'],
+        'pipe',
+        help='Pass the notebook to the pandoc subprocess and read the document from it with '
+             'pipes or with temporary files.',
+    ).tag(config=True)
+
+    remote_image_workers = Integer(
+        8,
+        help='Maximum number of concurrent downloads of remote images.',
+    ).tag(config=True)
+
+    remote_image_timeout = Float(
+        30,
+        help='Timeout for connecting to the server of a remote image and for every read in '
+             'seconds.',
+    ).tag(config=True)
+
+    remote_image_max_size = Integer(
+        100 * 1024 ** 2,
+        help='Maximum size of a remote image in bytes.',
+    ).tag(config=True)
+
+    remote_image_cache_dir = Unicode(
+        None,
+        allow_none=True,
+        help='Directory of the cache for remote images. Cached images are revalidated with '
+             'conditional requests. No cache is used if unset.',
+    ).tag(config=True)
+
+    remote_image_cache_size = Integer(
+        100 * 1024 ** 2,
+        help='Maximum size of the cache for remote images in bytes.',
+    ).tag(config=True)
+
+    remote_image_offline = Bool(
+        False,
+        help='Use only cached remote images without any requests.',
+    ).tag(config=True)
+
+    deduplicate_images = Bool(
+        True,
+        help='Keep only one copy of identical images attached to markdown cells.',
+    ).tag(config=True)
+
+    image_max_size = Integer(
+        None,
+        allow_none=True,
+        help='Maximum size of a linked image in bytes. There is no limit if unset.',
+    ).tag(config=True)
+
+    image_size_action = Enum(
+        ['warn', 'skip', 'downscale'],
+        'warn',
+        help='Action for linked images larger than image_max_size. They are embedded with a '
+             'warning, skipped or downscaled, which requires pillow.',
+    ).tag(config=True)
+
+    link_local_images = Bool(
+        False,
+        help='Pass linked local images to pandoc by their absolute path instead of embedding '
+             'them into the notebook, so they are never loaded into memory. Not supported by the '
+             'pandoc server backend.',
+    ).tag(config=True)
+
+    image_dpi = Integer(
+        None,
+        allow_none=True,
+        help='Resolution of printed images. If set, all png and jpeg images are resampled to at '
+             'most image_width inches with this resolution, which requires pillow, and plotly '
+             'figures are rendered with it.',
+    ).tag(config=True)
+
+    image_width = Float(
+        6.5,
+        help='Maximum printed width of resampled images in inches.',
+    ).tag(config=True)
+
+    image_format = Enum(
+        ['keep', 'png', 'jpeg'],
+        'keep',
+        help='Format of resampled images.',
+    ).tag(config=True)
+
+    image_jpeg_quality = Integer(
+        85,
+        help='Quality of resampled jpeg images from 1 to 95.',
+    ).tag(config=True)
+
+    image_workers = Integer(
+        4,
+        help='Number of images which are resampled at the same time.',
+    ).tag(config=True)
+
+    image_cache_dir = Unicode(
+        None,
+        allow_none=True,
+        help='Directory of the cache for resampled images. No cache is used if unset.',
+    ).tag(config=True)
+
+    image_cache_size = Integer(
+        100 * 1024 ** 2,
+        help='Maximum size of the cache for resampled images in bytes.',
+    ).tag(config=True)
+
+    table_workers = Integer(
+        1,
+        help='Number of processes which convert pandas tables at the same time. With a single '
+             'worker tables are converted in the current process.',
+    ).tag(config=True)
+
+    cell_cache_dir = Unicode(
+        None,
+        allow_none=True,
+        help='Directory of the cache for preprocessed cells, so only changed cells are '
+             'preprocessed again on the next export. No cache is used if unset.',
+    ).tag(config=True)
+
+    cell_cache_size = Integer(
+        100 * 1024 ** 2,
+        help='Maximum size of the cache for preprocessed cells in bytes.',
+    ).tag(config=True)
+
+    result_cache = Enum(
+        ['memory', 'directory'],
+        None,
+        allow_none=True,
+        help='Cache of converted documents, which are returned without any conversion if the '
+             'notebook and the options did not change. The memory cache is shared by all '
+             'exporters of the process, the directory cache is stored in result_cache_dir. No '
+             'cache is used if unset.',
+    ).tag(config=True)
+
+    result_cache_dir = Unicode(
+        None,
+        allow_none=True,
+        help='Directory of the result cache, if result_cache is directory.',
+    ).tag(config=True)
+
+    result_cache_size = Integer(
+        100 * 1024 ** 2,
+        help='Maximum size of the result cache in bytes.',
+    ).tag(config=True)
+
+    profile_dir = Unicode(
+        None,
+        allow_none=True,
+        help='Directory of profiles of conversions, which are named after the notebook and the '
+             'time of the conversion. If unset, the environment variable '
+             f'{PROFILE_DIR_ENV} is used. Conversions are not profiled if neither is set.',
+    ).tag(config=True)
+
+    profiler = Enum(
+        ['cprofile', 'pyinstrument'],
+        default_value='cprofile',
+        help='Profiler of conversions. pyinstrument has to be installed separately.',
+    ).tag(config=True)
+
+    profile_threshold = Float(
+        0.0,
+        help='Minimum duration of a profiled conversion in seconds, profiles of faster '
+             'conversions are discarded.',
+    ).tag(config=True)
+
+    _plotly_cache = None
+    _remote_image_cache = None
+    _image_cache = None
+    _cell_cache = None
+    _result_cache = None
+
     def _file_extension_default(self):
         return '.docx'
 
+    def _get_plotly_cache(self):
+        if self._plotly_cache is None and self.plotly_cache_dir is not None:
+            self._plotly_cache = DiskCache(self.plotly_cache_dir, self.plotly_cache_size)
+        return self._plotly_cache
+
+    def _get_remote_image_cache(self):
+        if self._remote_image_cache is None and self.remote_image_cache_dir is not None:
+            self._remote_image_cache = DiskCache(
+                self.remote_image_cache_dir, self.remote_image_cache_size,
+            )
+        return self._remote_image_cache
+
+    def _get_image_cache(self):
+        if self._image_cache is None and self.image_cache_dir is not None:
+            self._image_cache = DiskCache(self.image_cache_dir, self.image_cache_size)
+        return self._image_cache
+
+    def _get_cell_cache(self):
+        if self._cell_cache is None and self.cell_cache_dir is not None:
+            self._cell_cache = DiskCache(self.cell_cache_dir, self.cell_cache_size)
+        return self._cell_cache
+
+    def _get_result_cache(self):
+        if self._result_cache is None:
+            if self.result_cache == 'memory':
+                self._result_cache = get_memory_cache('result', self.result_cache_size)
+            elif self.result_cache == 'directory':
+                if self.result_cache_dir is None:
+                    raise ValueError('result_cache_dir is required for a directory result cache')
+                self._result_cache = DiskCache(self.result_cache_dir, self.result_cache_size)
+        return self._result_cache
+
     def from_notebook_node(self, nb, resources=None, **kw):
-        nb_copy, resources = super().from_notebook_node(nb, resources)
-
-        return (
-            converters.notebookcontent_to_docxbytes(
-                nb_copy, resources['metadata']['name'], resources['metadata']['path'],
-            ),
-            resources,
-        )
+        # the converters import pandoc and image libraries, which are not needed until the first
+        # conversion, e.g. if nbconvert only lists the available exporters
+        from . import converters
+
+        if any(_changes_notebook(preprocessor) for preprocessor in self._preprocessors):
+            # configured preprocessors change the notebook in place, so it is copied first
+            nb, resources = super().from_notebook_node(nb, resources)
+        else:
+            # the notebook is only read, preprocessing works on a copy of its containers
+            resources = self._init_resources(resources)
+            if 'language' in nb['metadata']:
+                resources['language'] = nb['metadata']['language'].lower()
+            notebook_name = os.path.join(
+                resources['metadata']['path'], resources['metadata']['name'],
+            )
+            self._nb_metadata[notebook_name] = nb['metadata']
+
+        # durations and counts of the conversion are returned with the resources
+        report = ConversionReport()
+        resources['docx_report'] = report
+
+        directory = get_profile_dir(self.profile_dir)
+        if directory is not None:
+            profiling = profile_conversion(
+                directory, resources['metadata']['name'], profiler=self.profiler,
+                threshold=self.profile_threshold, report=report, logger=self.log,
+            )
+        else:
+            profiling = contextlib.nullcontext()
+        with profiling:
+            docxbytes = converters.notebookcontent_to_docxbytes(
+                nb,
+                resources['metadata']['name'],
+                resources['metadata']['path'],
+                pandoc_filter=self.pandoc_filter,
+                pandoc_backend=self.pandoc_backend,
+                pandoc_io=self.pandoc_io,
+                result_cache=self._get_result_cache(),
+                remote_image_workers=self.remote_image_workers,
+                remote_image_timeout=self.remote_image_timeout,
+                remote_image_max_size=self.remote_image_max_size,
+                remote_image_cache=self._get_remote_image_cache(),
+                remote_image_offline=self.remote_image_offline,
+                deduplicate=self.deduplicate_images,
+                image_max_size=self.image_max_size,
+                image_size_action=self.image_size_action,
+                link_local_images=self.link_local_images,
+                image_dpi=self.image_dpi,
+                image_width=self.image_width,
+                image_format=None if self.image_format == 'keep' else self.image_format,
+                image_jpeg_quality=self.image_jpeg_quality,
+                image_workers=self.image_workers,
+                image_cache=self._get_image_cache(),
+                table_workers=self.table_workers,
+                cell_cache=self._get_cell_cache(),
+                plotly_workers=self.plotly_workers,
+                plotly_cache=self._get_plotly_cache(),
+                report=report,
+            )
+        self.log.debug(report.summary())
+        return docxbytes, resources
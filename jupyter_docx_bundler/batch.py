@@ -0,0 +1,227 @@
+import argparse
+from collections import namedtuple
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import glob
+import os
+from pathlib import Path
+import sys
+import time
+
+from traitlets.config import Config
+from traitlets.config.loader import KVArgParseConfigLoader
+
+BatchResult = namedtuple('BatchResult', ['notebook', 'output', 'success', 'error', 'duration'])
+BatchResult.__doc__ = """Result of the conversion of a single notebook
+
+Attributes
+----------
+notebook : str
+    Path of the notebook
+output : str
+    Path of the docx document
+success : bool
+    Whether the conversion succeeded
+error : str or None
+    Error message if the conversion failed
+duration : float
+    Duration of the conversion in seconds
+"""
+
+# exporter of the current process, it keeps its warm resources for all conversions
+_exporter = None
+
+
+def _init_worker(config):
+    global _exporter
+    from . import DocxExporter
+
+    _exporter = DocxExporter(config=Config(config))
+
+
+def _convert(notebook, output):
+    start = time.perf_counter()
+    try:
+        docxbytes, _ = _exporter.from_filename(notebook)
+        with open(output, 'wb') as file:
+            file.write(docxbytes)
+    except Exception as e:
+        return BatchResult(notebook, output, False, f'{type(e).__name__}: {e}',
+                           time.perf_counter() - start)
+    return BatchResult(notebook, output, True, None, time.perf_counter() - start)
+
+
+def expand_notebooks(patterns):
+    """Expand glob-patterns to notebook paths
+
+    Parameters
+    ----------
+    patterns : list of str
+        Paths or glob-patterns of notebooks, `**` matches any subdirectory
+
+    Returns
+    -------
+    list of str
+        Paths of notebooks in the order of `patterns` without duplicates
+
+    """
+    notebooks = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) \
+            else [pattern]
+        for notebook in matches:
+            if notebook not in notebooks:
+                notebooks.append(notebook)
+    return notebooks
+
+
+def output_paths(notebooks, output_dir=None):
+    """Get the paths of the docx documents of notebooks
+
+    In `output_dir` the directories of the notebooks below their common directory are mirrored,
+    so notebooks with the same name in different directories get different documents.
+
+    Parameters
+    ----------
+    notebooks : list of str
+        Paths of notebooks
+    output_dir : str, optional
+        Directory of the docx documents, by default they are stored next to the notebooks
+
+    Returns
+    -------
+    list of str
+        Paths of the docx documents in the order of `notebooks`
+
+    """
+    if output_dir is None:
+        return [f'{Path(notebook).with_suffix(".docx")}' for notebook in notebooks]
+    if len(notebooks) == 0:
+        return []
+    notebooks = [os.path.abspath(notebook) for notebook in notebooks]
+    root = os.path.commonpath([os.path.dirname(notebook) for notebook in notebooks])
+    return [
+        f'{(Path(output_dir) / os.path.relpath(notebook, root)).with_suffix(".docx")}'
+        for notebook in notebooks
+    ]
+
+
+def convert_notebooks(notebooks, output_dir=None, processes=None, config=None, callback=None):
+    """Convert several notebooks to docx documents with a pool of worker processes
+
+    Every worker process keeps its exporter for all its conversions, so resources like the pandoc
+    server, kaleido and caches are only started once per process.
+
+    Parameters
+    ----------
+    notebooks : list of str
+        Paths or glob-patterns of notebooks
+    output_dir : str, optional
+        Directory of the docx documents, which mirrors the directories of the notebooks below
+        their common directory. By default the documents are stored next to the notebooks.
+    processes : int, optional
+        Number of worker processes, by default the number of CPUs. With a single process the
+        notebooks are converted in the current process.
+    config : traitlets.config.Config or dict, optional
+        Configuration of the `DocxExporter`
+    callback : callable, optional
+        Called with the `BatchResult` of every notebook as soon as it is converted
+
+    Returns
+    -------
+    list of BatchResult
+        Results in the order of `notebooks`
+
+    """
+    notebooks = expand_notebooks(notebooks)
+    outputs = output_paths(notebooks, output_dir=output_dir)
+    for output in outputs:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    config = Config(config if config is not None else {})
+    processes = min(processes or os.cpu_count() or 1, max(len(notebooks), 1))
+
+    results = {}
+    if processes == 1:
+        _init_worker(config)
+        for notebook, output in zip(notebooks, outputs):
+            results[notebook] = _convert(notebook, output)
+            if callback is not None:
+                callback(results[notebook])
+    else:
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker, initargs=(config,),
+        ) as executor:
+            start = time.perf_counter()
+            futures = {
+                executor.submit(_convert, notebook, output): (notebook, output)
+                for notebook, output in zip(notebooks, outputs)
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # e.g. BrokenProcessPool, if a worker process was killed
+                    result = BatchResult(*futures[future], False, f'{type(e).__name__}: {e}',
+                                         time.perf_counter() - start)
+                results[result.notebook] = result
+                if callback is not None:
+                    callback(result)
+
+    return [results[notebook] for notebook in notebooks]
+
+
+def main(argv=None):
+    """Command line interface to convert several notebooks to docx documents"""
+    parser = argparse.ArgumentParser(
+        prog='jupyter-docx-bundler',
+        description='Convert Jupyter notebooks to docx documents. Further options of the exporter '
+                    'can be set like with nbconvert, e.g. --DocxExporter.plotly_workers=2.',
+    )
+    parser.add_argument(
+        'notebooks',
+        nargs='+',
+        help='Paths or glob-patterns of notebooks, ** matches any subdirectory',
+    )
+    parser.add_argument(
+        '-o', '--output-dir',
+        help='Directory of the docx documents, which mirrors the directories of the notebooks, '
+             'by default they are stored next to the notebooks',
+    )
+    parser.add_argument(
+        '-j', '--processes',
+        type=int,
+        help='Number of worker processes, by default the number of CPUs',
+    )
+    args, config_args = parser.parse_known_args(argv)
+    config = KVArgParseConfigLoader(config_args).load_config()
+    start = time.perf_counter()
+
+    notebooks = expand_notebooks(args.notebooks)
+    if len(notebooks) == 0:
+        print('No notebooks found', file=sys.stderr)
+        return 1
+
+    def report(result):
+        if result.success:
+            print(f'OK    {result.notebook} -> {result.output} ({result.duration:.2f} s)')
+        else:
+            print(f'FAIL  {result.notebook} ({result.duration:.2f} s): {result.error}')
+        sys.stdout.flush()
+
+    results = convert_notebooks(
+        notebooks,
+        output_dir=args.output_dir,
+        processes=args.processes,
+        config=config,
+        callback=report,
+    )
+    failed = sum(not result.success for result in results)
+    print(
+        f'Converted {len(results) - failed} of {len(results)} notebooks in '
+        f'{time.perf_counter() - start:.2f} s'
+    )
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+from collections import OrderedDict
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+import threading
+
+_memory_caches = {}
+_memory_caches_lock = threading.Lock()
+
+
+def hash_key(*parts):
+    """Build a cache key by hashing all parts
+
+    Parameters
+    ----------
+    *parts : str or bytes
+        Parts which identify the cached content
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest
+
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf8')
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+
+def package_version():
+    """Get the installed version of jupyter-docx-bundler, which is part of keys of results
+
+    Returns
+    -------
+    str
+        Version or `unknown` if the package is not installed
+
+    """
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        return 'unknown'
+    try:
+        return version('jupyter-docx-bundler')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+class DiskCache:
+    """Directory based cache of raw bytes with a size limit and least-recently-used eviction
+
+    Every entry is stored in its own file, the modification time of the file is used as time of
+    the last access. The directory can be shared by several processes.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Directory of the cache, it will be created if necessary
+    max_size : int, optional
+        Maximum size of all entries in bytes
+    """
+
+    def __init__(self, directory, max_size=100 * 1024 ** 2):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.directory / key[:2] / key
+
+    def _entries(self):
+        entries = []
+        for path in self.directory.glob('*/*'):
+            if path.name.startswith('.tmp-'):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key):
+        """Get an entry of the cache
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry
+
+        Returns
+        -------
+        bytes or None
+            Content of the entry or None if there is no entry
+
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value):
+        """Add an entry to the cache and evict least recently used entries if the cache is full
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry
+        value : bytes
+            Content of the entry
+
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so other processes never read incomplete entries
+        fd, tmpname = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(value)
+            os.replace(tmpname, path)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(value)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """Remove all entries of the cache"""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+
+class MemoryCache:
+    """In-memory cache of raw bytes with a size limit and least-recently-used eviction
+
+    It has the same interface as `DiskCache`, but is only shared by the threads of a process.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximum size of all entries in bytes
+    """
+
+    def __init__(self, max_size=100 * 1024 ** 2):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get an entry of the cache
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry
+
+        Returns
+        -------
+        bytes or None
+            Content of the entry or None if there is no entry
+
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Add an entry to the cache and evict least recently used entries if the cache is full
+
+        Parameters
+        ----------
+        key : str
+            Key of the entry
+        value : bytes
+            Content of the entry
+
+        """
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_size and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        """Remove all entries of the cache"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def get_memory_cache(name, max_size=100 * 1024 ** 2):
+    """Get an in-memory cache shared by all exporters of this process
+
+    Parameters
+    ----------
+    name : str
+        Name of the cache
+    max_size : int, optional
+        Maximum size of all entries in bytes, the size of an existing cache is updated
+
+    Returns
+    -------
+    MemoryCache
+
+    """
+    with _memory_caches_lock:
+        if name not in _memory_caches:
+            _memory_caches[name] = MemoryCache(max_size)
+        _memory_caches[name].max_size = max_size
+        return _memory_caches[name]
@@ -1,50 +1,49 @@
 import base64
-try:
-    from importlib.resources import files as resources_files
-except ImportError:
-    from importlib_resources import files as resources_files
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
 import os
 import re
+import subprocess
 import tempfile
+import time
 from pathlib import Path
+import warnings
 
 import nbformat
-import pandas as pd
 import pypandoc
-import requests
 from nbconvert import preprocessors
 
+from .cache import hash_key, package_version
+from .figures import render_plotly_figures
+from .images import (
+    deduplicate_images, downscale_image, encode_base64, rename_attachment, resample_images,
+)
+from .math_delimiters import normalize_math
+from .pandoc_filter import remove_empty_input_docx
+from .pandoc_server import get_pandoc_server, PandocServerError
+from .remote import fetch_image, fetch_images, RemoteImageError
+from .report import ConversionReport
+from .tables import convert_tables, TABLE_SCHEMA_MIMETYPE
+
 RE_IMAGE = re.compile(r'!\[.+]\((?!attachment:).+\)')
 RE_EXTRA_TITLE = re.compile(r'\s".+"')
-RE_MATH_SINGLE = re.compile(r'(?<=\$).+(?=\$)')
-RE_MATH_DOUBLE = re.compile(r'(?<=\$\$).+(?=\$\$)')
-
-
-def _strip_match(matchobj):
-    """Strip whitespace from a RE-match-object
-
-    Parameters
-    ----------
-    matchobj : re.Match
-        Match-object of regular-expression.
-
-    Returns
-    -------
-    str
-        Stripped string
 
-    """
-    return matchobj.group(0).strip()
+# mimetypes of image file extensions, which differ from the extension
+IMAGE_MIMETYPES = {
+    'jpg': 'image/jpeg',
+}
 
 
-def encode_image_base64(filepath):
+def encode_image_base64(filepath, data=None):
     """Encode an image as a base64 string
 
     Parameters
     ----------
     filepath : str
-        Filepath of the image file
+        Filepath or URL of the image file
+    data : bytes, optional
+        Raw image data, if the image was already read or downloaded
 
     Returns
     -------
@@ -53,13 +52,14 @@ def encode_image_base64(filepath):
 
     """
     name = os.path.split(filepath)[-1]
-    mime = 'image/' + os.path.splitext(filepath)[1][1:]
-    if f'{filepath}'.startswith('http'):
-        r = requests.get(filepath)
-        data = base64.b64encode(r.content).decode('utf8')
+    extension = os.path.splitext(filepath)[1][1:].lower()
+    mime = IMAGE_MIMETYPES.get(extension, f'image/{extension}')
+    if data is not None:
+        data = encode_base64(data)
+    elif f'{filepath}'.startswith('http'):
+        data = encode_base64(fetch_image(filepath))
     else:
-        with open(filepath, 'rb') as image:
-            data = base64.b64encode(image.read()).decode('utf8')
+        data = encode_base64(filepath)
 
     return nbformat.from_dict({name: {mime: data}})
 
@@ -78,6 +78,8 @@ def html_to_pandas_table(s):
     pandas.DataFrame
 
     """
+    import pandas as pd
+
     df = pd.read_html(s)[0]
     if isinstance(df.columns, pd.MultiIndex):
         # find columns which starts with "Unnamed"
@@ -123,11 +125,338 @@ def html_to_pandas_table(s):
     return df
 
 
-def preprocess(content, path, handler=None):
+def _is_pandas_table(output):
+    return 'data' in output and 'text/plain' in output['data'] and \
+        'text/html' in output['data'] and re.search('<table', output['data']['text/html'])
+
+
+def render_plotly_outputs(content, handler=None, workers=1, cache=None, scale=2.0, report=None):
+    """Render all plotly figures of the notebook to png-images
+
+    The rendered image is stored as `image/png` in the data of each output with a plotly figure.
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+    handler : tornado.web.RequestHandler, optional
+        Handler that serviced the bundle request
+    workers : int, optional
+        Number of plotly figures which are rendered at the same time
+    cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of rendered images
+    scale : float, optional
+        Scale of the rendered images relative to the size of the figures in CSS pixels
+    report : jupyter_docx_bundler.report.ConversionReport, optional
+        Report, which counts the failures logged with the handler
+
+    """
+    outputs = [
+        output
+        for cell in content['cells']
+        for output in cell.get('outputs', [])
+        if 'data' in output and 'application/vnd.plotly.v1+json' in output['data'] and
+        not _is_pandas_table(output)
+    ]
+    if len(outputs) == 0:
+        return
+
+    try:
+        images = render_plotly_figures(
+            [output['data']['application/vnd.plotly.v1+json'] for output in outputs],
+            format='png',
+            scale=scale,
+            workers=workers,
+            cache=cache,
+        )
+    except ModuleNotFoundError as e:
+        if handler is not None:
+            handler.log.warning('Found plotly-figure in notebook, we need plotly '
+                                'and kaleido to convert figure.')
+            if report is not None:
+                report.count('failures')
+            return
+        else:
+            raise e
+
+    for output, imagedata in zip(outputs, images):
+        output['data']['image/png'] = base64.b64encode(imagedata).decode('utf8')
+
+
+def resample_notebook_images(content, handler=None, width=6.5, dpi=150, format=None, quality=85,
+                             workers=1, cache=None, report=None):
+    """Resample all png- and jpeg-images of the notebook to a printed width and resolution
+
+    Attachments of markdown cells and image outputs, including rendered plotly figures, are
+    reduced to at most `width * dpi` pixels and re-encoded optimized.
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+    handler : tornado.web.RequestHandler, optional
+        Handler that serviced the bundle request
+    width : float, optional
+        Maximum printed width of the images in inches
+    dpi : int, optional
+        Resolution of the printed images
+    format : {'png', 'jpeg'}, optional
+        Format of the resampled images, by default the format of every image is kept
+    quality : int, optional
+        Quality of jpeg images from 1 to 95
+    workers : int, optional
+        Number of images which are resampled at the same time
+    cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of resampled images
+    report : jupyter_docx_bundler.report.ConversionReport, optional
+        Report, which counts the failures logged with the handler
+
+    """
+    # bundle and mimetype of every image, with cell and name of attachments
+    targets = []
+    for cell in content['cells']:
+        for name, bundle in cell.get('attachments', {}).items():
+            for mime in ('image/png', 'image/jpeg'):
+                if mime in bundle:
+                    targets.append((bundle, mime, cell, name))
+        for output in cell.get('outputs', []):
+            for mime in ('image/png', 'image/jpeg'):
+                if mime in output.get('data', {}):
+                    targets.append((output['data'], mime, None, None))
+    if len(targets) == 0:
+        return
+
+    try:
+        images = resample_images(
+            [base64.b64decode(''.join(bundle[mime])) for bundle, mime, _, _ in targets],
+            round(width * dpi),
+            dpi=dpi,
+            format=format,
+            quality=quality,
+            workers=workers,
+            cache=cache,
+        )
+    except ModuleNotFoundError as e:
+        if handler is not None:
+            handler.log.warning('Resampling of images requires pillow.')
+            if report is not None:
+                report.count('failures')
+            return
+        else:
+            raise e
+    except Exception as e:
+        if handler is not None:
+            handler.log.warning(f'Resampling of images failed : {e}')
+            if report is not None:
+                report.count('failures')
+            return
+        else:
+            raise e
+
+    for (bundle, mime, cell, name), (imagedata, imageformat) in zip(targets, images):
+        new_mime = f'image/{imageformat}'
+        del bundle[mime]
+        bundle[new_mime] = encode_base64(imagedata)
+        if cell is not None and new_mime != mime:
+            rename_attachment(cell, name, f'{os.path.splitext(name)[0]}.{imageformat}')
+
+
+def _table_output(output, context):
+    """Replace a pandas table, already converted by convert_tables, with a markdown cell"""
+    if id(output) not in context['tables']:
+        return None
+    markdown = context['tables'][id(output)]
+    if isinstance(markdown, Exception):
+        # the handler is registered for several mimetypes of the table, it is reported only once
+        del context['tables'][id(output)]
+        # the HTML is converted, if the table schema fails
+        kind = 'HTML-table' if _is_pandas_table(output) else 'table schema'
+        if context['handler'] is None:
+            raise markdown
+        context['handler'].log.warning(f'Conversion of pandas {kind} failed : {markdown}')
+        return None
+    return [nbformat.v4.new_markdown_cell(markdown)]
+
+
+def _latex_output(output, context):
+    """Replace latex, but not of code cells which write HTML too, with a markdown cell"""
+    if 'text/html' in output['data']:
+        return None
+    return [nbformat.v4.new_markdown_cell(source=output['data']['text/latex'])]
+
+
+def _markdown_output(output, context):
+    """Replace markdown with a markdown cell"""
+    if 'text/plain' not in output['data']:
+        return None
+    return [nbformat.v4.new_markdown_cell(source=output['data']['text/markdown'])]
+
+
+# handlers of outputs by mimetype in the order of their priority
+OUTPUT_HANDLERS = [
+    (TABLE_SCHEMA_MIMETYPE, _table_output),
+    ('text/html', _table_output),
+    ('text/latex', _latex_output),
+    ('text/markdown', _markdown_output),
+]
+
+
+def register_output_handler(mimetype, handler=None):
+    """Register a handler for outputs with a mimetype
+
+    Registered handlers take precedence over the built-in handlers and handlers registered
+    before. A handler is called with the output and a dictionary with the request `handler`,
+    the `path` of the notebook and the converted `tables`. It returns a list of cells which
+    replace the output and are placed after its cell, or None to keep the output and pass it to
+    the next handler of its mimetypes.
+
+    Parameters
+    ----------
+    mimetype : str
+        Mimetype of the outputs
+    handler : callable, optional
+        Handler of the outputs. If it is not given, a decorator is returned.
+
+    Returns
+    -------
+    callable
+        The handler
+
+    """
+    if handler is None:
+        return lambda handler: register_output_handler(mimetype, handler)
+    OUTPUT_HANDLERS.insert(0, (mimetype, handler))
+    return handler
+
+
+def _dispatch_output(output, context):
+    if 'data' not in output:
+        return None
+    for mimetype, handler in OUTPUT_HANDLERS:
+        if mimetype in output['data']:
+            cells = handler(output, context)
+            if cells is not None:
+                return cells
+    return None
+
+
+def _linked_image_states(cell, path):
+    """Get path, modification time and size of local images linked in a cell or its markdown and
+    latex outputs, which can change without the cell, and the URLs of remote images"""
+    sources = [cell['source']] if cell['cell_type'] == 'markdown' else []
+    for output in cell.get('outputs', []):
+        for mimetype in ('text/markdown', 'text/latex'):
+            if mimetype in output.get('data', {}):
+                source = output['data'][mimetype]
+                sources.append(''.join(source) if isinstance(source, list) else source)
+    states = []
+    for source in sources:
+        for link in RE_IMAGE.findall(source):
+            _, image, _ = _parse_image_link(link, Path(path))
+            if isinstance(image, str):
+                states.append(image)
+                continue
+            try:
+                stat = os.stat(image)
+            except OSError:
+                continue
+            states.append(f'{image}:{stat.st_mtime_ns}:{stat.st_size}')
+    return states
+
+
+def _output_handlers_key():
+    return [f'{mimetype}:{h.__module__}.{h.__qualname__}' for mimetype, h in OUTPUT_HANDLERS]
+
+
+def _cell_key(cell, path, options):
+    """Get the key of a cell in the cell cache or None if it can not be cached"""
+    states = _linked_image_states(cell, path)
+    if any(state.startswith('http') for state in states):
+        return None
+    return hash_key('cell', json.dumps(cell, sort_keys=True), options, *states)
+
+
+def _copy_cell(cell):
+    cell = nbformat.NotebookNode(cell)
+    cell['metadata'] = nbformat.NotebookNode(cell['metadata'])
+    if 'outputs' in cell:
+        outputs = []
+        for output in cell['outputs']:
+            output = nbformat.NotebookNode(output)
+            if 'data' in output:
+                output['data'] = nbformat.NotebookNode(output['data'])
+            outputs.append(output)
+        cell['outputs'] = outputs
+    if 'attachments' in cell:
+        cell['attachments'] = nbformat.NotebookNode({
+            name: nbformat.NotebookNode(bundle) for name, bundle in cell['attachments'].items()
+        })
+    return cell
+
+
+def copy_notebook(content):
+    """Copy the notebook down to the level, which is changed by `preprocess`
+
+    Cells, their metadata, outputs and attachments are copied, but not their sources and the data
+    of the outputs and attachments, so the copy needs only a small part of the memory of the
+    notebook. Replacing values of the copied containers keeps the original notebook unchanged.
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+
+    Returns
+    -------
+    nbformat.NotebookNode
+
+    """
+    content = nbformat.NotebookNode(content)
+    content['cells'] = [_copy_cell(cell) for cell in content['cells']]
+    return content
+
+
+def _image_bytes(content):
+    """Estimate the size of all images of outputs and attachments from their base64-encoding"""
+    size = 0
+    for cell in content['cells']:
+        bundles = [output.get('data', {}) for output in cell.get('outputs', [])]
+        bundles.extend(cell.get('attachments', {}).values())
+        for bundle in bundles:
+            for mime, data in bundle.items():
+                if mime.startswith('image/') and mime != 'image/svg+xml':
+                    length = sum(map(len, data)) if isinstance(data, list) else len(data)
+                    size += length * 3 // 4
+    return size
+
+
+def _count_failures(report, results):
+    """Count the exceptions of failed downloads or conversions"""
+    failures = sum(isinstance(result, Exception) for result in results)
+    if failures > 0:
+        report.count('failures', failures)
+
+
+def preprocess(content, path, handler=None, plotly_workers=1, plotly_cache=None,
+               remote_image_workers=8, remote_image_timeout=30,
+               remote_image_max_size=100 * 1024 ** 2, remote_image_cache=None,
+               remote_image_offline=False, deduplicate=True, image_max_size=None,
+               image_size_action='warn', link_local_images=False, image_dpi=None,
+               image_width=6.5, image_format=None, image_jpeg_quality=85, image_workers=4,
+               image_cache=None, table_workers=1, cell_cache=None, report=None):
     """Preprocess the notebook data.
     * Cells will specific tags will be removed and attached images will be embedded.
     * Input of cells with specific tags will be prepared for later removal with a pandoc filter
     * Math-formulas will be fixed to comply with pandoc-requirements
+    * Pandas-tables will be converted to markdown in parallel, from their table schema if
+      available
+    * Plotly-figures will be rendered to images
+    * Remote images will be downloaded concurrently
+    * Images will be resampled to a printed width and resolution
+    * Identical images will be kept only once
+    * Unchanged cells will be taken from the cache of an earlier export
+
+    The notebook itself is not changed, a copy made by `copy_notebook` is preprocessed.
 
     Parameters
     ----------
@@ -137,6 +466,50 @@ def preprocess(content, path, handler=None):
         Path to the notebook as string
     handler : tornado.web.RequestHandler, optional
         Handler that serviced the bundle request
+    plotly_workers : int, optional
+        Number of plotly figures which are rendered at the same time
+    plotly_cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of rendered plotly figures
+    remote_image_workers : int, optional
+        Maximum number of concurrent downloads of remote images
+    remote_image_timeout : float, optional
+        Timeout for connecting to the server and for every read in seconds
+    remote_image_max_size : int, optional
+        Maximum size of a remote image in bytes
+    remote_image_cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of remote images, which are revalidated with conditional requests
+    remote_image_offline : bool, optional
+        Use only cached remote images without any requests
+    deduplicate : bool, optional
+        Keep only one copy of identical images attached to markdown cells
+    image_max_size : int, optional
+        Maximum size of a linked image in bytes, by default there is no limit
+    image_size_action : {'warn', 'skip', 'downscale'}, optional
+        Action for linked images larger than `image_max_size`
+    link_local_images : bool, optional
+        Link local images with their absolute path instead of embedding them, so pandoc reads them
+        directly from disk
+    image_dpi : int, optional
+        Resolution of the printed images, images are only resampled if it is set. Plotly figures
+        are rendered with this resolution too.
+    image_width : float, optional
+        Maximum printed width of the images in inches
+    image_format : {'png', 'jpeg'}, optional
+        Format of resampled images, by default the format of every image is kept
+    image_jpeg_quality : int, optional
+        Quality of resampled jpeg images from 1 to 95
+    image_workers : int, optional
+        Number of images which are resampled at the same time
+    image_cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of resampled images
+    table_workers : int, optional
+        Number of processes which convert tables at the same time
+    cell_cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of preprocessed cells. Cells linking remote images are not cached, so they are
+        revalidated on every export, and no cells are cached if any conversion failed.
+    report : jupyter_docx_bundler.report.ConversionReport, optional
+        Report, which records the durations of the stages and cells of the preprocessing, the
+        counts of the converted content and the number of `failures` of downloads and conversions
 
     Returns
     -------
@@ -144,102 +517,381 @@ def preprocess(content, path, handler=None):
         Preprocessed notebook content
 
     """
-    if 'jupyter-docx-bundler' in content['metadata'] and \
-            'exclude_input' in content['metadata']['jupyter-docx-bundler'] and \
-            content['metadata']['jupyter-docx-bundler']['exclude_input'] in (True, 'True'):
-        for cell in content['cells']:
-            if cell['cell_type'] == 'code':
-                if 'tags' not in cell['metadata']:
-                    cell['metadata']['tags'] = []
-                cell['metadata']['tags'].append('nbconvert-remove-input')
-
-    # Use cell tags
-    tag_preprocessor = preprocessors.TagRemovePreprocessor()
-    tag_preprocessor.remove_cell_tags.add('nbconvert-remove-cell')
-    tag_preprocessor.remove_input_tags.add('nbconvert-remove-input')
-    tag_preprocessor.preprocess(content, {})
-
-    # Apply non-standard operations on cells
-    for ii, cell in enumerate(content['cells']):
-        # Set input of cells with transient 'remove_source' to later remove it with a pandoc-filter
-        if 'transient' in cell['metadata'] and 'remove_source' in cell['metadata']['transient'] \
-                and cell['metadata']['transient']['remove_source']:
-            cell['source'] = 'jupyter-docx-bundler-remove-input'
-            del cell['metadata']['transient']
-        # Replace whitespace in math formulas
-        if cell['cell_type'] == 'markdown':
-            cell['source'] = RE_MATH_SINGLE.sub(_strip_match, cell['source'])
-            cell['source'] = RE_MATH_DOUBLE.sub(_strip_match, cell['source'])
-
-        # process outputs
-        if 'outputs' in cell:
-            for jj, output in enumerate(cell['outputs']):
-                # pandas table
-                if 'data' in output and 'text/plain' in output['data'] and \
-                        'text/html' in output['data'] and \
-                        re.search('<table', output['data']['text/html']):
-                    try:
-                        content['cells'].insert(
-                            ii + 1,
-                            nbformat.v4.new_markdown_cell(
-                                html_to_pandas_table(output['data']['text/html']).to_markdown(),
-                            )
-                        )
-                        del cell['outputs'][jj]
-                    except Exception as e:
-                        if handler is not None:
-                            handler.log.warning(f'Conversion of pandas HTML-table failed : {e}')
-                        else:
-                            raise e
-                # plotly figure
-                elif 'data' in output and 'application/vnd.plotly.v1+json' in output['data']:
-                    try:
-                        from plotly import io
-                        from kaleido.scopes.plotly import PlotlyScope
-
-                        scope = PlotlyScope(
-                            plotlyjs=resources_files('plotly') / 'package_data' / 'plotly.min.js',
-                        )
-
-                        fig = io.from_json(
-                            json.dumps(output['data']['application/vnd.plotly.v1+json'])
-                        )
-                        imagedata = scope.transform(fig, format='png', scale=2.0)
-                        output['data']['image/png'] = base64.b64encode(imagedata)
-                    except ModuleNotFoundError as e:
-                        if handler is not None:
-                            handler.log.warning('Found plotly-figure in notebook, we need plotly '
-                                                'and kaleido to convert figure.')
-                        else:
-                            raise e
-                # latex but not code cells (it write also a latex output)
-                elif 'data' in output and 'text/latex' in output['data'] and \
-                        'text/html' not in output['data']:
-                    content['cells'].insert(
-                        ii + 1,
-                        nbformat.v4.new_markdown_cell(
-                            source=output['data']['text/latex'],
-                        ),
-                    )
-                    del cell['outputs'][jj]
-                # markdown
-                elif 'data' in output and 'text/plain' in output['data'] and \
-                        'text/markdown' in output['data']:
-                    content['cells'].insert(
-                        ii + 1,
-                        nbformat.v4.new_markdown_cell(
-                            source=output['data']['text/markdown'],
-                        )
-                    )
-                    del cell['outputs'][jj]
+    if report is None:
+        report = ConversionReport()
+    failures = report.counts.get('failures', 0)
+
+    with report.stage('tags'):
+        # work on a copy of the containers, which shares the sources and output data of all cells
+        content = copy_notebook(content)
+
+        if 'jupyter-docx-bundler' in content['metadata'] and \
+                'exclude_input' in content['metadata']['jupyter-docx-bundler'] and \
+                content['metadata']['jupyter-docx-bundler']['exclude_input'] in (True, 'True'):
+            for cell in content['cells']:
+                if cell['cell_type'] == 'code':
+                    cell['metadata']['tags'] = \
+                        list(cell['metadata'].get('tags', [])) + ['nbconvert-remove-input']
+
+        # Use cell tags
+        tag_preprocessor = preprocessors.TagRemovePreprocessor()
+        tag_preprocessor.remove_cell_tags.add('nbconvert-remove-cell')
+        tag_preprocessor.remove_input_tags.add('nbconvert-remove-input')
+        tag_preprocessor.preprocess(content, {})
+    report.count('cells', len(content['cells']))
+
+    # Take unchanged cells from the cache, only the remaining cells are processed
+    cell_keys = [None] * len(content['cells'])
+    cached_cells = {}
+    if cell_cache is not None:
+        with report.stage('cell_cache'):
+            options = json.dumps([
+                path, image_max_size, image_size_action, link_local_images, image_dpi,
+                image_width, image_format, image_jpeg_quality, package_version(),
+                _output_handlers_key(),
+            ])
+            for ii, cell in enumerate(content['cells']):
+                cell_keys[ii] = _cell_key(cell, path, options)
+                value = cell_cache.get(cell_keys[ii]) if cell_keys[ii] is not None else None
+                if value is not None:
+                    cached_cells[ii] = [nbformat.from_dict(x) for x in json.loads(value)]
+        report.count('cached_cells', len(cached_cells))
+    pending_indexes = [ii for ii in range(len(content['cells'])) if ii not in cached_cells]
+    pending = {'cells': [content['cells'][ii] for ii in pending_indexes]}
+
+    # Render plotly figures in advance, so they can be rendered concurrently
+    # plotly figures are sized in CSS pixels with 96 per inch
+    with report.stage('plotly'):
+        report.count('plotly_figures', sum(
+            'data' in output and 'application/vnd.plotly.v1+json' in output['data']
+            for cell in pending['cells'] for output in cell.get('outputs', [])
+        ))
+        render_plotly_outputs(
+            pending,
+            handler=handler,
+            workers=plotly_workers,
+            cache=plotly_cache,
+            scale=image_dpi / 96 if image_dpi is not None else 2.0,
+            report=report,
+        )
+
+    # Convert all tables in advance, so they can be converted in parallel
+    with report.stage('tables'):
+        table_outputs = [
+            output
+            for cell in pending['cells']
+            for output in cell.get('outputs', [])
+            if 'data' in output and TABLE_SCHEMA_MIMETYPE in output['data'] or
+            _is_pandas_table(output)
+        ]
+        tables = dict(zip(
+            [id(output) for output in table_outputs],
+            convert_tables(
+                [
+                    {
+                        mimetype: output['data'][mimetype]
+                        for mimetype in (TABLE_SCHEMA_MIMETYPE, 'text/html', 'text/plain')
+                        if mimetype in output['data'] and
+                        (mimetype != 'text/html' or _is_pandas_table(output))
+                    }
+                    for output in table_outputs
+                ],
+                workers=table_workers,
+            ),
+        ))
+    report.count('tables', len(tables))
+    _count_failures(report, tables.values())
+
+    # Rewrite cells, outputs are replaced by the cells their handlers return, which are placed
+    # after their cell
+    context = {'handler': handler, 'path': path, 'tables': tables}
+    processed_cells = []
+    durations = []
+    with report.stage('cells'):
+        for cell in pending['cells']:
+            start = time.perf_counter()
+            # Set input of cells with transient 'remove_source' to later remove it with a
+            # pandoc-filter
+            if 'transient' in cell['metadata'] and \
+                    'remove_source' in cell['metadata']['transient'] and \
+                    cell['metadata']['transient']['remove_source']:
+                cell['source'] = 'jupyter-docx-bundler-remove-input'
+                del cell['metadata']['transient']
+
+            # process outputs
+            new_cells = []
+            if 'outputs' in cell:
+                outputs = []
+                for output in cell['outputs']:
+                    replacement = _dispatch_output(output, context)
+                    if replacement is None:
+                        outputs.append(output)
+                    else:
+                        new_cells.extend(replacement)
+                cell['outputs'] = outputs
+
+            # Replace whitespace in math formulas
+            for new_cell in [cell] + new_cells:
+                if new_cell['cell_type'] == 'markdown':
+                    new_cell['source'] = normalize_math(new_cell['source'])
+            processed_cells.append([cell] + new_cells)
+            durations.append(time.perf_counter() - start)
+
+    # Download all remote images in advance, so they can be downloaded concurrently, including
+    # those linked by markdown cells of outputs
+    with report.stage('remote_images'):
+        remote_images = fetch_images(
+            remote_image_urls({'cells': [x for cells in processed_cells for x in cells]}),
+            workers=remote_image_workers,
+            timeout=remote_image_timeout,
+            max_size=remote_image_max_size,
+            cache=remote_image_cache,
+            offline=remote_image_offline,
+        )
+    report.count('remote_images', len(remote_images))
+    report.count('remote_image_bytes', sum(
+        len(data) for data in remote_images.values() if not isinstance(data, Exception)
+    ))
+    _count_failures(report, remote_images.values())
 
-        # convert linked images to attachments
-        linked_to_attachment_image(cell, path)
+    # convert linked images to attachments
+    encoded_images = {}
+    with report.stage('cells'):
+        for index, cells, duration in zip(pending_indexes, processed_cells, durations):
+            start = time.perf_counter()
+            for new_cell in cells:
+                linked_to_attachment_image(
+                    new_cell,
+                    path,
+                    images=remote_images,
+                    handler=handler,
+                    encoded_images=encoded_images,
+                    max_size=image_max_size,
+                    size_action=image_size_action,
+                    link_local=link_local_images,
+                )
+            report.add_cell(
+                index, cells[0]['cell_type'], duration + time.perf_counter() - start,
+            )
+    report.count('linked_images', len(encoded_images))
+
+    if image_dpi is not None:
+        with report.stage('resample'):
+            resample_notebook_images(
+                {'cells': [x for cells in processed_cells for x in cells]},
+                handler=handler,
+                width=image_width,
+                dpi=image_dpi,
+                format=image_format,
+                quality=image_jpeg_quality,
+                workers=image_workers,
+                cache=image_cache,
+                report=report,
+            )
+
+    # Put cached and processed cells together and store the processed cells, unless a conversion
+    # failed, e.g. as kaleido or pillow are missing, which would be repeated for all later exports
+    cache_cells = report.counts.get('failures', 0) == failures
+    processed_cells = iter(processed_cells)
+    cells = []
+    for ii in range(len(content['cells'])):
+        if ii in cached_cells:
+            cells.extend(cached_cells[ii])
+            continue
+        new_cells = next(processed_cells)
+        if cell_keys[ii] is not None and cache_cells:
+            with report.stage('cell_cache'):
+                cell_cache.set(cell_keys[ii], json.dumps(new_cells).encode('utf8'))
+        cells.extend(new_cells)
+    content['cells'] = cells
+
+    if deduplicate:
+        with report.stage('deduplicate'):
+            deduplicate_images(content)
+    report.count('image_bytes', _image_bytes(content))
 
     return content
 
 
-def notebookcontent_to_docxbytes(content, filename, path, handler=None):
+def notebook_chunks(content, size=1024 ** 2, sort_keys=False):
+    """Serialize the notebook to JSON chunk by chunk
+
+    Unlike `nbformat.writes` the notebook is neither copied nor validated and the JSON document
+    is never held in memory as a whole.
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+    size : int, optional
+        Minimum number of characters of a chunk, only the last chunk can be smaller
+    sort_keys : bool, optional
+        Sort the keys of all dictionaries, so equal notebooks give the same chunks
+
+    Yields
+    ------
+    bytes
+        utf8-encoded chunk of the JSON document
+
+    """
+    parts = []
+    length = 0
+    for part in json.JSONEncoder(ensure_ascii=False, sort_keys=sort_keys).iterencode(content):
+        parts.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(parts).encode('utf8')
+            parts = []
+            length = 0
+    if parts:
+        yield ''.join(parts).encode('utf8')
+
+
+def run_pandoc(source, from_format, to_format, extra_args=()):
+    """Convert a document with a pandoc subprocess, which reads from stdin and writes to stdout
+
+    Parameters
+    ----------
+    source : bytes or iterable of bytes
+        Content of the document or its chunks, which are written to pandoc while they are
+        generated
+    from_format : str
+        Input format of pandoc
+    to_format : str
+        Output format of pandoc
+    extra_args : list of str, optional
+        Further arguments of pandoc
+
+    Returns
+    -------
+    bytes
+        Converted document
+
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = [source]
+    with subprocess.Popen(
+        [
+            pypandoc.get_pandoc_path(),
+            f'--from={from_format}',
+            f'--to={to_format}',
+            '--output=-',
+            *extra_args,
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as proc:
+        # read the output concurrently, so pandoc never blocks on a full pipe
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stdout = executor.submit(proc.stdout.read)
+            stderr = executor.submit(proc.stderr.read)
+            try:
+                for chunk in source:
+                    proc.stdin.write(chunk)
+                proc.stdin.close()
+            except BrokenPipeError:
+                # pandoc stopped reading, its error is raised below
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            except BaseException:
+                proc.kill()
+                raise
+            stdout = stdout.result()
+            stderr = stderr.result()
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f'Pandoc died with exitcode "{proc.returncode}" during conversion: '
+            f'{stderr.decode("utf8", errors="replace")}'
+        )
+    return stdout
+
+
+def pandoc_metadata(content, handler=None):
+    """Get the metadata of the notebook, which is passed to pandoc
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+    handler : tornado.web.RequestHandler, optional
+        Handler that serviced the bundle request
+
+    Returns
+    -------
+    dict
+        Metadata as strings with the pandoc metadata field as key
+
+    """
+    metadata = {}
+    if content['metadata'] is not None:
+        if 'authors' in content['metadata']:
+            if isinstance(content['metadata']['authors'], list) and all(
+                    ['name' in x for x in content['metadata']['authors']]
+            ):
+                author_list = [x["name"] for x in content["metadata"]["authors"]]
+                metadata['author'] = ", ".join(author_list)
+            elif handler is not None:
+                handler.log.warning(
+                    'Author metadata has wrong format, see https://github.com/m-rossi/jupyter_'
+                    'docx_bundler/blob/main/README.md'
+                )
+        for key in ('title', 'subtitle', 'date'):
+            if key in content['metadata']:
+                metadata[key] = f'{content["metadata"][key]}'
+    return metadata
+
+
+def result_key(content, path, pandoc_filter='lua', **kwargs):
+    """Get the key of the docx document of a notebook in the result cache
+
+    The key covers the notebook, its path for relative images, the state of linked local images,
+    the metadata passed to pandoc, all options which change the document and the versions of
+    pandoc and jupyter-docx-bundler.
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+    path : str
+        Path to the notebook as string
+    pandoc_filter : {'lua', 'python'}, optional
+        Implementation of the pandoc filter which removes hidden inputs
+    **kwargs
+        Further options passed to `preprocess`, caches and numbers of workers are ignored
+
+    Returns
+    -------
+    str
+
+    """
+    options = {
+        key: value for key, value in kwargs.items()
+        if not key.endswith(('_cache', '_workers'))
+    }
+    # hash the notebook chunk by chunk, so its JSON document is never held in memory as a whole
+    notebook_hash = hashlib.sha256()
+    for chunk in notebook_chunks(content, sort_keys=True):
+        notebook_hash.update(chunk)
+    return hash_key(
+        'docx',
+        notebook_hash.digest(),
+        f'{path}',
+        json.dumps(pandoc_metadata(content), sort_keys=True),
+        pandoc_filter,
+        json.dumps(options, sort_keys=True),
+        json.dumps(_output_handlers_key()),
+        pypandoc.get_pandoc_version(),
+        package_version(),
+        *[state for cell in content['cells'] for state in _linked_image_states(cell, path)],
+    )
+
+
+def notebookcontent_to_docxbytes(content, filename, path, handler=None, pandoc_filter='lua',
+                                 pandoc_backend='subprocess', pandoc_io='pipe',
+                                 result_cache=None, report=None, **kwargs):
     """Convert content of a Jupyter notebook to the raw bytes content of a *.docx file
 
     Parameters
@@ -252,64 +904,222 @@ def notebookcontent_to_docxbytes(content, filename, path, handler=None):
         Handler that serviced the bundle request
     path : str
         Path to the notebook as string
+    pandoc_filter : {'lua', 'python'}, optional
+        Implementation of the pandoc filter which removes hidden inputs. The lua filter runs
+        inside of pandoc, the python filter in a separate Python interpreter.
+    pandoc_backend : {'subprocess', 'server'}, optional
+        Run pandoc as a new subprocess for every conversion or convert with a long-lived pandoc
+        server. If the server is not available, a subprocess is used.
+    pandoc_io : {'pipe', 'file'}, optional
+        Pass the notebook to the pandoc subprocess and read the document from it with pipes or
+        with temporary files
+    result_cache : jupyter_docx_bundler.cache.DiskCache or MemoryCache, optional
+        Cache of converted documents, which are returned without any conversion. Remote images
+        of cached documents are not revalidated. Documents of conversions with failures, which
+        are logged as warnings, are not cached.
+    report : jupyter_docx_bundler.report.ConversionReport, optional
+        Report, which records the durations of the stages and cells of the conversion and the
+        counts of the converted content. Its summary is logged, if a handler is given.
+    **kwargs
+        Further options passed to `preprocess`
+
     Returns
     -------
     bytes
 
     """
-    with tempfile.TemporaryDirectory() as tempdir:
-        # preprocess notebook
-        content = preprocess(content, path, handler=handler)
+    if pandoc_filter not in ('lua', 'python'):
+        raise ValueError(f'Unknown pandoc filter: {pandoc_filter}')
+    if pandoc_backend not in ('subprocess', 'server'):
+        raise ValueError(f'Unknown pandoc backend: {pandoc_backend}')
+    if pandoc_io not in ('pipe', 'file'):
+        raise ValueError(f'Unknown pandoc io: {pandoc_io}')
+    if report is None:
+        report = ConversionReport()
 
-        # prepare file names
-        ipynbfile = os.path.join(tempdir, f'{filename}.ipynb')
-        docxfile = os.path.join(tempdir, f'{filename}.docx')
+    if result_cache is not None:
+        with report.stage('result_cache'):
+            key = result_key(content, path, pandoc_filter=pandoc_filter, **kwargs)
+            docxbytes = result_cache.get(key)
+        if docxbytes is not None:
+            report.count('result_cache_hits')
+            if handler is not None:
+                report.log(handler.log)
+            return docxbytes
+        failures = report.counts.get('failures', 0)
+        docxbytes = notebookcontent_to_docxbytes(
+            content, filename, path, handler=handler, pandoc_filter=pandoc_filter,
+            pandoc_backend=pandoc_backend, pandoc_io=pandoc_io, report=report, **kwargs,
+        )
+        # documents of conversions with failures, e.g. of downloads, are converted again
+        if report.counts.get('failures', 0) == failures:
+            with report.stage('result_cache'):
+                result_cache.set(key, docxbytes)
+        return docxbytes
 
-        # set extra args for pandoc
-        extra_args = []
-        if content['metadata'] is not None:
-            if 'authors' in content['metadata']:
-                if isinstance(content['metadata']['authors'], list) and all(
-                        ['name' in x for x in content['metadata']['authors']]
-                ):
-                    author_list = [x["name"] for x in content["metadata"]["authors"]]
-                    extra_args.append(
-                        f'--metadata=author:' f'{", ".join(author_list)}'
-                    )
-                elif handler is not None:
-                    handler.log.warning(
-                        'Author metadata has wrong format, see https://github.com/m-rossi/jupyter_'
-                        'docx_bundler/blob/main/README.md'
+    # the pandoc server can not read local files, so they have to be embedded
+    if pandoc_backend == 'server':
+        kwargs['link_local_images'] = False
+
+    # preprocess notebook
+    with report.stage('preprocess'):
+        content = preprocess(content, path, handler=handler, report=report, **kwargs)
+
+    docxbytes = _pandoc_to_docx(
+        content, filename, handler, pandoc_filter, pandoc_backend, pandoc_io, report,
+    )
+    report.count('docx_bytes', len(docxbytes))
+    if handler is not None:
+        report.log(handler.log)
+    return docxbytes
+
+
+def _pandoc_to_docx(content, filename, handler, pandoc_filter, pandoc_backend, pandoc_io,
+                    report):
+    """Convert the preprocessed notebook to docx with pandoc"""
+    # get metadata for pandoc
+    metadata = pandoc_metadata(content, handler=handler)
+
+    if pandoc_backend == 'server':
+        try:
+            # the server can not run filters, so hidden inputs are removed afterwards
+            with report.stage('pandoc_server'):
+                return remove_empty_input_docx(
+                    get_pandoc_server().convert(
+                        json.dumps(content, ensure_ascii=False), 'ipynb', 'docx',
+                        metadata=metadata,
                     )
-            if 'title' in content['metadata']:
-                extra_args.append(f'--metadata=title:{content["metadata"]["title"]}')
-            if 'subtitle' in content['metadata']:
-                extra_args.append(f'--metadata=subtitle:{content["metadata"]["subtitle"]}')
-            if 'date' in content['metadata']:
-                extra_args.append(f'--metadata=date:{content["metadata"]["date"]}')
+                )
+        except (OSError, PandocServerError) as e:
+            if handler is not None:
+                handler.log.warning(f'Conversion with pandoc server failed, use subprocess : {e}')
 
-        nbformat.write(content, ipynbfile)
+    # set extra args for pandoc
+    extra_args = [f'--metadata={key}:{value}' for key, value in metadata.items()]
 
-        # add filter specification to args
+    # add filter specification to args
+    if pandoc_filter == 'lua':
+        extra_args.append('--lua-filter')
+        extra_args.append(f'{(Path(__file__).parent / "pandoc_filter.lua").absolute()}')
+    else:
         extra_args.append('--filter')
         extra_args.append(f'{(Path(__file__).parent / "pandoc_filter.py").absolute()}')
 
+    # the python filter runs in its own interpreter, which pandoc starts
+    stage = 'pandoc' if pandoc_filter == 'lua' else 'pandoc_python_filter'
+    if pandoc_io == 'pipe':
+        with report.stage(stage):
+            return run_pandoc(notebook_chunks(content), 'ipynb', 'docx', extra_args)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        # prepare file names
+        ipynbfile = os.path.join(tempdir, f'{filename}.ipynb')
+        docxfile = os.path.join(tempdir, f'{filename}.docx')
+
+        with report.stage('write'):
+            with open(ipynbfile, 'wb') as file:
+                for chunk in notebook_chunks(content):
+                    file.write(chunk)
+
         # convert to docx
-        pypandoc.convert_file(
-            ipynbfile,
-            'docx',
-            outputfile=docxfile,
-            extra_args=extra_args,
-        )
+        with report.stage(stage):
+            pypandoc.convert_file(
+                ipynbfile,
+                'docx',
+                outputfile=docxfile,
+                extra_args=extra_args,
+            )
 
         # read raw data
-        with open(docxfile, 'rb') as bundle_file:
-            rawdata = bundle_file.read()
+        with report.stage('read'):
+            with open(docxfile, 'rb') as bundle_file:
+                rawdata = bundle_file.read()
 
         return rawdata
 
 
-def linked_to_attachment_image(cell, path):
+def _parse_image_link(image, path):
+    # split markdown link by alt and link
+    alt, image = image.split('](')
+    # search for an additional title and save it for later
+    if RE_EXTRA_TITLE.search(image):
+        title = rf' "{RE_EXTRA_TITLE.search(image).group(0)[1:]}"'
+    else:
+        title = ''
+    # replace extra title in image link
+    image = RE_EXTRA_TITLE.sub('', image)
+    if image.startswith('http'):
+        image = image[:-1]
+    elif Path(image[:-1]).is_absolute():
+        image = Path(image[:-1])
+    else:
+        image = (path / Path(image[:-1])).resolve()
+    return alt, image, title
+
+
+def remote_image_urls(content):
+    """Get the URLs of all remote images linked in markdown cells of the notebook
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+
+    Returns
+    -------
+    list of str
+
+    """
+    urls = []
+    for cell in content['cells']:
+        if cell['cell_type'] == 'markdown':
+            for image in RE_IMAGE.findall(cell['source']):
+                _, image, _ = _parse_image_link(image, Path('.'))
+                if isinstance(image, str):
+                    urls.append(image)
+    return urls
+
+
+def _warn(message, handler=None):
+    if handler is not None:
+        handler.log.warning(message)
+    else:
+        warnings.warn(message)
+
+
+def _linked_image(image, data=None, handler=None, max_size=None, size_action='warn',
+                  link_local=False):
+    """Get the attachment of a linked image, its absolute path or None if it is skipped"""
+    if isinstance(image, str) and data is None:
+        data = fetch_image(image)
+    size = len(data) if data is not None else os.path.getsize(image)
+
+    if max_size is not None and size > max_size:
+        message = f'Linked image {image} is larger than {max_size} bytes'
+        if size_action == 'skip':
+            _warn(f'{message}, it is skipped', handler)
+            return None
+        elif size_action == 'downscale':
+            try:
+                data, format = downscale_image(data if data is not None else image, max_size)
+            except ModuleNotFoundError as e:
+                if handler is None:
+                    raise e
+                handler.log.warning(f'{message}, we need pillow to downscale it.')
+            else:
+                return encode_image_base64(
+                    f'{os.path.splitext(image)[0]}.{format}', data=data,
+                )
+        else:
+            _warn(message, handler)
+
+    if link_local and data is None:
+        return image
+    return encode_image_base64(image, data=data)
+
+
+def linked_to_attachment_image(cell, path, images=None, handler=None, encoded_images=None,
+                               max_size=None, size_action='warn', link_local=False):
     """Converts cell with linked images of notebook cell to attachment image.
 
     Parameters
@@ -318,32 +1128,69 @@ def linked_to_attachment_image(cell, path):
         Cell with attachments
     path : str
         Path to the notebook as string
+    images : dict, optional
+        Already downloaded remote images, raw image data or the error of the download with the
+        URL as key
+    handler : tornado.web.RequestHandler, optional
+        Handler that serviced the bundle request
+    encoded_images : dict, optional
+        Already encoded images with the filepath or URL as key, newly encoded images are added
+    max_size : int, optional
+        Maximum size of a linked image in bytes, by default there is no limit
+    size_action : {'warn', 'skip', 'downscale'}, optional
+        Action for images larger than `max_size`. They are embedded with a warning, replaced by
+        their alternative text or downscaled to `max_size`, which requires pillow.
+    link_local : bool, optional
+        Link local images with their absolute path instead of embedding them, so pandoc reads them
+        directly from disk
     """
     path = Path(path)
+    if images is None:
+        images = {}
+    if encoded_images is None:
+        encoded_images = {}
+    if size_action not in ('warn', 'skip', 'downscale'):
+        raise ValueError(f'Unknown size action: {size_action}')
     if cell['cell_type'] == 'markdown':
         s = RE_IMAGE.split(cell['source'])
-        images = RE_IMAGE.findall(cell['source'])
-        for ii, image in enumerate(images):
-            # split markdown link by alt and link
-            alt, image = image.split('](')
-            # search for an additional title and save it for later
-            if RE_EXTRA_TITLE.search(image):
-                title = rf' "{RE_EXTRA_TITLE.search(image).group(0)[1:]}"'
-            else:
-                title = ''
-            # replace extra title in image link
-            image = RE_EXTRA_TITLE.sub('', image)
-            if image.startswith('http'):
-                image = image[:-1]
-            elif Path(image[:-1]).is_absolute():
-                image = Path(image[:-1])
-            else:
-                image = (path / Path(image[:-1])).resolve()
-            nn = encode_image_base64(image)
-            key = list(nn.keys())[0]
-            s.insert(ii + 1, f'{alt}](attachment:{key}{title})')
-            if 'attachments' in cell:
-                cell['attachments'].update(nn)
+        links = RE_IMAGE.findall(cell['source'])
+        source = [s[0]]
+        for link, text in zip(links, s[1:]):
+            alt, image, title = _parse_image_link(link, path)
+            try:
+                if image not in encoded_images:
+                    data = images.get(image) if isinstance(image, str) else None
+                    if isinstance(data, Exception):
+                        raise data
+                    encoded_images[image] = _linked_image(
+                        image,
+                        data=data,
+                        handler=handler,
+                        max_size=max_size,
+                        size_action=size_action,
+                        link_local=link_local,
+                    )
+                nn = encoded_images[image]
+            except RemoteImageError as e:
+                if handler is None:
+                    raise e
+                # keep the link, if the image can not be downloaded
+                handler.log.warning(f'Embedding of linked image failed : {e}')
+                source.append(link)
+                source.append(text)
+                continue
+            if nn is None:
+                # skipped image, keep its alternative text
+                source.append(alt[2:])
+            elif isinstance(nn, Path):
+                source.append(f'{alt}](<{nn.as_posix()}>{title})')
             else:
-                cell['attachments'] = nn
-        cell['source'] = ''.join(s)
+                key = list(nn.keys())[0]
+                source.append(f'{alt}](attachment:{key}{title})')
+                # every cell gets its own bundle, which is changed by resampling
+                if 'attachments' in cell:
+                    cell['attachments'].update(nbformat.from_dict(nn))
+                else:
+                    cell['attachments'] = nbformat.from_dict(nn)
+            source.append(text)
+        cell['source'] = ''.join(source)
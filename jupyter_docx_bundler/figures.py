@@ -0,0 +1,186 @@
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from importlib.resources import files as resources_files
+except ImportError:
+    from importlib_resources import files as resources_files
+import json
+import queue
+import threading
+
+from .cache import hash_key
+
+_scopes = []
+_scopes_lock = threading.Lock()
+
+
+class ManagedPlotlyScope:
+    """Kaleido scope for plotly figures which is started lazily on the first transform, restarted
+    if the kaleido subprocess crashed and shut down explicitly.
+
+    Starting a kaleido scope launches a headless Chromium, so a single instance should be reused
+    for as many figures as possible.
+    """
+
+    def __init__(self):
+        self._scope = None
+        self._lock = threading.Lock()
+
+    def _get_scope(self):
+        if self._scope is None:
+            from kaleido.scopes.plotly import PlotlyScope
+
+            self._scope = PlotlyScope(
+                plotlyjs=resources_files('plotly') / 'package_data' / 'plotly.min.js',
+            )
+        return self._scope
+
+    def _is_alive(self):
+        # kaleido does not expose the state of its subprocess, a scope which did not start its
+        # subprocess yet is considered alive
+        proc = getattr(self._scope, '_proc', None)
+        return proc is None or proc.poll() is None
+
+    def _shutdown_scope(self):
+        if self._scope is not None:
+            try:
+                self._scope._shutdown_kaleido()
+            except Exception:
+                pass
+            self._scope = None
+
+    def transform(self, figure, format='png', scale=2.0):
+        """Convert a plotly figure to a static image
+
+        Parameters
+        ----------
+        figure : plotly.graph_objects.Figure or dict
+            Plotly figure or its dictionary representation
+        format : str, optional
+            Image format
+        scale : float, optional
+            Scale factor of the image with respect to the layout size of the figure
+
+        Returns
+        -------
+        bytes
+            Raw image data
+
+        """
+        with self._lock:
+            scope = self._get_scope()
+            try:
+                return scope.transform(figure, format=format, scale=scale)
+            except (OSError, ValueError):
+                if self._is_alive():
+                    # kaleido is still running, the figure itself could not be converted
+                    raise
+            # kaleido crashed during the transform, start a new one and try once again
+            self._shutdown_scope()
+            return self._get_scope().transform(figure, format=format, scale=scale)
+
+    def shutdown(self):
+        """Shut down the kaleido subprocess, it will be started again on the next transform"""
+        with self._lock:
+            self._shutdown_scope()
+
+
+def get_plotly_scopes(n):
+    """Get kaleido scopes shared by all plotly figures of this process
+
+    Parameters
+    ----------
+    n : int
+        Number of scopes, missing scopes will be created
+
+    Returns
+    -------
+    list of ManagedPlotlyScope
+
+    """
+    with _scopes_lock:
+        while len(_scopes) < n:
+            scope = ManagedPlotlyScope()
+            atexit.register(scope.shutdown)
+            _scopes.append(scope)
+        return _scopes[:n]
+
+
+def get_plotly_scope():
+    """Get the kaleido scope shared by all plotly figures of this process
+
+    Returns
+    -------
+    ManagedPlotlyScope
+
+    """
+    return get_plotly_scopes(1)[0]
+
+
+def render_plotly_figures(figures, format='png', scale=2.0, workers=1, cache=None):
+    """Render plotly figures to static images concurrently
+
+    Every worker uses its own kaleido scope, so up to `workers` figures are rendered at the same
+    time. Figures found in `cache` are not rendered again.
+
+    Parameters
+    ----------
+    figures : list of dict
+        Plotly figures as dictionary, e.g. the content of `application/vnd.plotly.v1+json`
+        outputs
+    format : str, optional
+        Image format
+    scale : float, optional
+        Scale factor of the images with respect to the layout size of the figures
+    workers : int, optional
+        Maximum number of kaleido scopes rendering at the same time
+    cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of rendered images
+
+    Returns
+    -------
+    list of bytes
+        Raw image data in the order of `figures`
+
+    """
+    import plotly
+
+    images = [None] * len(figures)
+    keys = [None] * len(figures)
+    if cache is not None:
+        for ii, figure in enumerate(figures):
+            keys[ii] = hash_key(
+                json.dumps(figure, sort_keys=True), format, repr(scale), plotly.__version__,
+            )
+            images[ii] = cache.get(keys[ii])
+    missing = [ii for ii, image in enumerate(images) if image is None]
+    if len(missing) == 0:
+        return images
+
+    workers = max(1, min(workers, len(missing)))
+    scopes = queue.Queue()
+    for scope in get_plotly_scopes(workers):
+        scopes.put(scope)
+
+    def render(ii):
+        from plotly import io
+
+        fig = io.from_json(json.dumps(figures[ii]))
+        scope = scopes.get()
+        try:
+            image = scope.transform(fig, format=format, scale=scale)
+        finally:
+            scopes.put(scope)
+        if cache is not None:
+            cache.set(keys[ii], image)
+        return image
+
+    if workers == 1:
+        rendered = [render(ii) for ii in missing]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render, missing))
+    for ii, image in zip(missing, rendered):
+        images[ii] = image
+
+    return images
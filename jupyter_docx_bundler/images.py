@@ -0,0 +1,301 @@
+import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import os
+import re
+
+from nbformat import NotebookNode
+
+from .cache import hash_key
+
+# multiple of 3, so every chunk is encoded to base64 without padding
+CHUNK_SIZE = 3 * 1024 ** 2
+
+# formats which are kept by downscale_image, all others are stored as png
+DOWNSCALE_FORMATS = {'PNG', 'JPEG', 'GIF'}
+
+# formats which are written by resample_image
+RESAMPLE_FORMATS = {'PNG', 'JPEG'}
+
+
+def encode_base64(data):
+    """Encode raw data or the content of a file as a base64 string
+
+    A file is read and encoded chunk by chunk into a single buffer, so its raw data is never held
+    in memory completely. At the end the encoded data is held twice, in the buffer and in the
+    returned string, so the peak is about 2.7 times the size of the file.
+
+    Parameters
+    ----------
+    data : bytes or str or pathlib.Path
+        Raw data or path of a file
+
+    Returns
+    -------
+    str
+
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return base64.b64encode(data).decode('ascii')
+
+    encoded = bytearray()
+    with open(data, 'rb') as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            encoded += binascii.b2a_base64(chunk, newline=False)
+    return encoded.decode('ascii')
+
+
+def _resizable(img):
+    if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+        return img.convert('RGBA' if 'A' in img.mode else 'RGB')
+    return img
+
+
+def _flatten(img):
+    """Remove transparency of an image for formats without alpha channel"""
+    from PIL import Image
+
+    if img.mode in ('L', 'RGB'):
+        return img
+    if 'A' not in img.mode and 'transparency' not in img.info:
+        return img.convert('RGB')
+    img = img.convert('RGBA')
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel('A'))
+    return background
+
+
+def downscale_image(image, max_size):
+    """Reduce the resolution of an image until it is smaller than a maximum size
+
+    Requires Pillow. Images in formats other than png, jpeg and gif are converted to png.
+
+    Parameters
+    ----------
+    image : bytes or str or pathlib.Path
+        Raw data or path of the image
+    max_size : int
+        Maximum size of the downscaled image in bytes
+
+    Returns
+    -------
+    data : bytes
+        Raw data of the downscaled image
+    format : str
+        Format of the downscaled image in lower case, e.g. `png`
+
+    """
+    from PIL import Image
+
+    if isinstance(image, (bytes, bytearray)):
+        size = len(image)
+        image = io.BytesIO(image)
+    else:
+        size = os.path.getsize(image)
+
+    with Image.open(image) as img:
+        format = img.format if img.format in DOWNSCALE_FORMATS else 'PNG'
+        # the size of the encoded image is roughly proportional to the number of pixels
+        factor = min(1.0, (max_size / size) ** 0.5)
+        original_width, original_height = img.size
+        while True:
+            width = max(1, int(original_width * factor))
+            height = max(1, int(original_height * factor))
+            # decode large jpeg images with reduced resolution
+            img.draft('RGB', (width, height))
+            small = _resizable(img).resize((width, height), Image.LANCZOS)
+            data = io.BytesIO()
+            small.save(data, format, optimize=True)
+            if data.tell() <= max_size or width == 1 and height == 1:
+                return data.getvalue(), format.lower()
+            factor *= 0.8
+
+
+def _attachment_name(name, bundle):
+    """Get a name for an attachment derived from its content"""
+    mime, data = next(iter(bundle.items()))
+    if isinstance(data, list):
+        data = ''.join(data)
+    digest = hashlib.sha1(base64.b64decode(data)).hexdigest()
+    ext = os.path.splitext(name)[1] or '.' + mime.split('/')[-1].split('+')[0]
+    return f'{digest}{ext}'
+
+
+def resample_image(data, max_width, dpi=None, format=None, quality=85):
+    """Reduce the width of an image to a maximum number of pixels and re-encode it optimized
+
+    Requires Pillow. Smaller images are not enlarged and kept as they are if re-encoding does not
+    reduce their size.
+
+    Parameters
+    ----------
+    data : bytes
+        Raw data of the image
+    max_width : int
+        Maximum width of the image in pixels
+    dpi : int, optional
+        Resolution which is stored in resampled images, so they are printed with
+        `max_width / dpi` inches
+    format : {'png', 'jpeg'}, optional
+        Format of the resampled image, by default the format is kept. Formats other than png and
+        jpeg are converted to png.
+    quality : int, optional
+        Quality of jpeg images from 1 to 95
+
+    Returns
+    -------
+    data : bytes
+        Raw data of the resampled image
+    format : str
+        Format of the resampled image in lower case
+
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        source_format = img.format
+        format = (format or source_format).upper()
+        if format not in RESAMPLE_FORMATS:
+            format = 'PNG'
+
+        options = {'optimize': True}
+        resize = img.width > max_width
+        if resize:
+            height = max(1, round(img.height * max_width / img.width))
+            # decode large jpeg images with reduced resolution
+            img.draft('RGB', (max_width, height))
+            out = _resizable(img).resize((max_width, height), Image.LANCZOS)
+            if dpi is not None:
+                options['dpi'] = (dpi, dpi)
+        else:
+            out = img
+        if not resize and 'dpi' in img.info:
+            options['dpi'] = img.info['dpi']
+        if format == 'JPEG':
+            out = _flatten(out)
+            options['quality'] = quality
+
+        result = io.BytesIO()
+        out.save(result, format, **options)
+
+    if not resize and format == source_format and result.tell() >= len(data):
+        return data, format.lower()
+    return result.getvalue(), format.lower()
+
+
+def resample_images(images, max_width, dpi=None, format=None, quality=85, workers=1,
+                    cache=None):
+    """Resample several images in parallel with `resample_image`
+
+    Parameters
+    ----------
+    images : list of bytes
+        Raw data of the images
+    max_width : int
+        Maximum width of the images in pixels
+    dpi : int, optional
+        Resolution which is stored in resampled images
+    format : {'png', 'jpeg'}, optional
+        Format of the resampled images, by default the format of every image is kept
+    quality : int, optional
+        Quality of jpeg images from 1 to 95
+    workers : int, optional
+        Number of images which are resampled at the same time
+    cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of resampled images
+
+    Returns
+    -------
+    list of tuple
+        Raw data and format of the resampled images in the order of `images`
+
+    """
+    import PIL
+
+    if len(images) == 0:
+        return []
+
+    def resample(data):
+        key = hash_key(
+            'resample-image', data, f'{max_width}', f'{dpi}', f'{format}', f'{quality}',
+            PIL.__version__,
+        )
+        if cache is not None:
+            value = cache.get(key)
+            if value is not None:
+                cached_format, _, cached = value.partition(b'\n')
+                return cached, cached_format.decode('ascii')
+        result, result_format = resample_image(
+            data, max_width, dpi=dpi, format=format, quality=quality,
+        )
+        if cache is not None:
+            cache.set(key, result_format.encode('ascii') + b'\n' + result)
+        return result, result_format
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(images)))) as executor:
+        return list(executor.map(resample, images))
+
+
+def rename_attachment(cell, name, new_name):
+    """Rename an attachment of a markdown cell and all references to it
+
+    Parameters
+    ----------
+    cell : nbformat.NotebookNode
+        Cell with the attachment
+    name : str
+        Name of the attachment
+    new_name : str
+        New name of the attachment
+
+    """
+    cell['source'] = re.sub(
+        rf'attachment:{re.escape(name)}(?=[\s)])',
+        lambda _: f'attachment:{new_name}',
+        cell['source'],
+    )
+    if name in cell.get('attachments', {}):
+        cell['attachments'][new_name] = cell['attachments'].pop(name)
+
+
+def deduplicate_images(content):
+    """Keep only one copy of every image attached to markdown cells of the notebook
+
+    Attachments are renamed after the hash of their content and references to them are updated.
+    pandoc keeps the images of all cells in a single store, so an attachment is only kept in the
+    first cell using it and all other cells refer to this copy. Output images are named after
+    their content by pandoc as well, so attachments with the same content as an output image are
+    stored only once in the docx document too.
+
+    Parameters
+    ----------
+    content : nbformat.NotebookNode
+        A dict-like node of the notebook with attribute-access
+
+    Returns
+    -------
+    content : nbformat.NotebookNode
+        Notebook content with deduplicated attachments
+
+    """
+    seen = set()
+    for cell in content['cells']:
+        if 'attachments' not in cell or not cell['attachments']:
+            continue
+        attachments = {}
+        for name, bundle in list(cell['attachments'].items()):
+            if not bundle:
+                continue
+            new_name = _attachment_name(name, bundle)
+            if new_name != name:
+                rename_attachment(cell, name, new_name)
+            if new_name not in seen:
+                seen.add(new_name)
+                attachments[new_name] = bundle
+        cell['attachments'] = NotebookNode(attachments)
+    return content
@@ -0,0 +1,108 @@
+import re
+
+# escaped characters, code spans and math delimiters, which are relevant for finding formulas
+RE_MATH_TOKEN = re.compile(r'\\.|`+|\$\$|\$|\n', re.DOTALL)
+
+
+def _math_tokens(source):
+    """Find all dollar signs outside of code, which can delimit formulas
+
+    Returns
+    -------
+    list of tuple
+        Position, delimiter and line of every dollar sign
+
+    """
+    tokens = []
+    line = 0
+    # backtick runs without a closing run of the same length, they are no code spans
+    unclosed = set()
+    pos = 0
+    while True:
+        match = RE_MATH_TOKEN.search(source, pos)
+        if match is None:
+            return tokens
+        token = match.group(0)
+        pos = match.end()
+        if token == '\n':
+            line += 1
+        elif token[0] == '$':
+            tokens.append((match.start(), token, line))
+        elif token[0] == '`' and len(token) not in unclosed:
+            # skip code span or fenced code block up to the closing backticks
+            end = source.find(token, pos)
+            while end != -1:
+                run_end = end + len(token)
+                while source.startswith('`', run_end):
+                    run_end += 1
+                if run_end - end == len(token):
+                    break
+                end = source.find(token, run_end)
+            if end == -1:
+                unclosed.add(len(token))
+            else:
+                line += source.count('\n', pos, end)
+                pos = end + len(token)
+        elif token[0] == '\\' and token[1] == '\n':
+            line += 1
+
+
+def normalize_math(source):
+    """Strip whitespace inside of inline `$...$` and display `$$...$$` formulas
+
+    pandoc only reads formulas without whitespace after the opening and before the closing
+    delimiter. Formulas are found in a single pass: escaped dollar signs and dollar signs in code
+    are ignored, inline formulas end on the same line, dollar signs before a digit neither open nor
+    close a formula, so amounts of money are kept, and display formulas can span several lines.
+
+    Parameters
+    ----------
+    source : str
+        Markdown source
+
+    Returns
+    -------
+    str
+
+    """
+    if '$' not in source:
+        return source
+    tokens = _math_tokens(source)
+
+    # a dollar sign before a digit is a currency sign, which neither opens nor closes a formula
+    currency = [
+        delimiter == '$' and source[pos + 1:pos + 2].isdigit() for pos, delimiter, _ in tokens
+    ]
+
+    # index of the next possible closing delimiter of every token
+    next_single = [None] * len(tokens)
+    next_double = [None] * len(tokens)
+    single = double = None
+    for ii in range(len(tokens) - 1, -1, -1):
+        pos, delimiter, line = tokens[ii]
+        if single is not None and tokens[single][2] != line:
+            single = None
+        next_single[ii] = single
+        next_double[ii] = double
+        if delimiter == '$$':
+            double = ii
+        elif not currency[ii]:
+            single = ii
+
+    parts = []
+    last = 0
+    ii = 0
+    while ii < len(tokens):
+        pos, delimiter, _ = tokens[ii]
+        closing = next_double[ii] if delimiter == '$$' else next_single[ii]
+        if closing is None or currency[ii]:
+            ii += 1
+            continue
+        start = pos + len(delimiter)
+        end = tokens[closing][0]
+        parts.append(source[last:start])
+        parts.append(source[start:end].strip())
+        last = end
+        ii = closing + 1
+    parts.append(source[last:])
+    return ''.join(parts)
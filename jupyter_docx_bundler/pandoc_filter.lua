@@ -0,0 +1,8 @@
+-- Pandoc filter to remove the input of cells, which is marked for removal by the preprocessing.
+-- It does the same as pandoc_filter.py, but runs inside of pandoc.
+
+function CodeBlock(el)
+  if el.text == 'jupyter-docx-bundler-remove-input' then
+    return {}
+  end
+end
@@ -1,9 +1,62 @@
-from pandocfilters import toJSONFilter, Null
+import io
+import zipfile
+
+from pandocfilters import toJSONFilter
+
+REMOVE_INPUT = 'jupyter-docx-bundler-remove-input'
+WORDML_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
 
 
 def remove_empty_input(key, value, format, meta):
-    if key == 'CodeBlock' and value[1] == 'jupyter-docx-bundler-remove-input':
-        return Null()
+    if key == 'CodeBlock' and value[1] == REMOVE_INPUT:
+        return []
+
+
+def remove_empty_input_docx(docxbytes):
+    """Remove the input of cells, which is marked for removal, from a docx document. This is
+    used for conversions, which can not run a pandoc filter.
+
+    Parameters
+    ----------
+    docxbytes : bytes
+        Raw bytes content of the *.docx file
+
+    Returns
+    -------
+    bytes
+
+    """
+    from lxml import etree
+
+    w = f'{{{WORDML_NAMESPACE}}}'
+    with zipfile.ZipFile(io.BytesIO(docxbytes)) as docx:
+        document = etree.fromstring(docx.read('word/document.xml'))
+
+        # code is highlighted with several runs per paragraph, so compare the joined text
+        paragraphs = [
+            p for p in document.iter(f'{w}p')
+            if ''.join(p.itertext()) == REMOVE_INPUT and
+            p.find(f'{w}pPr/{w}pStyle[@{w}val="SourceCode"]') is not None
+        ]
+        if len(paragraphs) == 0:
+            return docxbytes
+        for p in paragraphs:
+            p.getparent().remove(p)
+
+        rawdata = io.BytesIO()
+        with zipfile.ZipFile(rawdata, 'w', zipfile.ZIP_DEFLATED) as output:
+            for item in docx.infolist():
+                if item.filename == 'word/document.xml':
+                    output.writestr(
+                        item,
+                        etree.tostring(
+                            document, xml_declaration=True, encoding='UTF-8', standalone=True,
+                        ),
+                    )
+                else:
+                    output.writestr(item, docx.read(item.filename))
+
+    return rawdata.getvalue()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+import atexit
+import base64
+import json
+import os
+from pathlib import Path
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pypandoc
+
+# output formats, which pandoc server returns base64-encoded
+BINARY_FORMATS = {'docx', 'epub', 'epub2', 'epub3', 'odt', 'pptx'}
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class PandocServerError(RuntimeError):
+    """Raised if the pandoc server can not be started or a conversion failed"""
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class PandocServer:
+    """Long-lived `pandoc server` process on localhost, which is started lazily on the first
+    conversion and restarted if the process died.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Maximum duration of a single conversion in seconds
+    startup_timeout : float, optional
+        Maximum duration to wait for the server to accept connections in seconds
+    """
+
+    def __init__(self, timeout=300, startup_timeout=10):
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.url = None
+        self._proc = None
+        self._tempdir = None
+        self._lock = threading.Lock()
+
+    def _command(self, port):
+        args = ['--port', f'{port}', '--timeout', f'{int(self.timeout)}']
+        pandoc = pypandoc.get_pandoc_path()
+        version = [int(x) for x in pypandoc.get_pandoc_version().split('.')[:2]]
+        if version >= [3, 0]:
+            return [pandoc, 'server'] + args
+        if version < [2, 18]:
+            raise PandocServerError(
+                f'pandoc server requires pandoc 2.18 or later, found {".".join(map(str, version))}'
+            )
+        # pandoc 2.18 and 2.19 only run as server if the executable is called pandoc-server
+        executable = shutil.which('pandoc-server')
+        if executable is None:
+            if self._tempdir is None:
+                self._tempdir = tempfile.TemporaryDirectory()
+            executable = Path(self._tempdir.name) / 'pandoc-server'
+            if not executable.exists():
+                os.symlink(pandoc, executable)
+        return [f'{executable}'] + args
+
+    def _start(self):
+        port = _free_port()
+        try:
+            self._proc = subprocess.Popen(
+                self._command(port),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise PandocServerError(f'Could not start pandoc server: {e}') from e
+        self.url = f'http://127.0.0.1:{port}'
+
+        # wait until the server accepts connections
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f'{self.url}/version', timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.05)
+        self._stop()
+        raise PandocServerError('pandoc server did not start')
+
+    def _stop(self):
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                self._proc.terminate()
+                try:
+                    self._proc.wait(timeout=2.0)
+                except subprocess.TimeoutExpired:
+                    self._proc.kill()
+                    self._proc.wait()
+            self._proc = None
+            self.url = None
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self._stop()
+                self._start()
+            return self.url
+
+    def convert(self, text, from_format, to_format, metadata=None):
+        """Convert a document with the pandoc server
+
+        Parameters
+        ----------
+        text : str
+            Content of the document
+        from_format : str
+            Input format of pandoc
+        to_format : str
+            Output format of pandoc
+        metadata : dict, optional
+            String-valued metadata of the document, like `--metadata` of pandoc
+
+        Returns
+        -------
+        bytes
+            Converted document
+
+        """
+        url = self._ensure_running()
+        params = {'text': text, 'from': from_format, 'to': to_format, 'standalone': True}
+        if metadata:
+            params['metadata'] = {
+                key: {'t': 'MetaString', 'c': value} for key, value in metadata.items()
+            }
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(params).encode('utf8'),
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout + 10) as response:
+                result = json.loads(response.read().decode('utf8'))
+        except urllib.error.HTTPError as e:
+            raise PandocServerError(
+                f'pandoc server failed: {e.read().decode("utf8", errors="replace")}'
+            ) from e
+
+        # pandoc 2 returns the output only, pandoc 3 an object with the output and information
+        # about its encoding
+        if isinstance(result, dict):
+            if result.get('error'):
+                raise PandocServerError(f'pandoc server failed: {result["error"]}')
+            is_base64 = result.get('base64', False)
+            result = result['output']
+        else:
+            is_base64 = to_format in BINARY_FORMATS
+        if is_base64:
+            return base64.b64decode(result)
+        return result.encode('utf8')
+
+    def shutdown(self):
+        """Stop the pandoc server, it will be started again on the next conversion"""
+        with self._lock:
+            self._stop()
+            if self._tempdir is not None:
+                self._tempdir.cleanup()
+                self._tempdir = None
+
+
+def get_pandoc_server():
+    """Get the pandoc server shared by all conversions of this process
+
+    Returns
+    -------
+    PandocServer
+
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = PandocServer()
+            atexit.register(_server.shutdown)
+        return _server
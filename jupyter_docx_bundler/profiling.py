@@ -0,0 +1,149 @@
+import contextlib
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import time
+
+# directory of profiles, if it is not configured for the exporter
+PROFILE_DIR_ENV = 'JUPYTER_DOCX_BUNDLER_PROFILE_DIR'
+
+
+def _children_cpu_time():
+    """Get user and system CPU time of all finished and waited for subprocesses of the process"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime, usage.ru_stime
+
+
+class _CProfiler:
+    extension = '.prof'
+
+    def __init__(self):
+        import cProfile
+
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, path):
+        self._profile.dump_stats(f'{path}')
+
+
+class _PyinstrumentProfiler:
+    extension = '.html'
+
+    def __init__(self):
+        from pyinstrument import Profiler
+
+        self._profiler = Profiler()
+
+    def start(self):
+        self._profiler.start()
+
+    def stop(self):
+        self._profiler.stop()
+
+    def write(self, path):
+        Path(path).write_text(self._profiler.output_html(), encoding='utf8')
+
+
+PROFILERS = {
+    'cprofile': _CProfiler,
+    'pyinstrument': _PyinstrumentProfiler,
+}
+
+
+@contextlib.contextmanager
+def profile_conversion(directory, name, profiler='cprofile', threshold=0.0, report=None,
+                       logger=None):
+    """Profile the conversion of a notebook within the context
+
+    The profile is written to `<directory>/<name>-<timestamp>.prof` for cProfile or `.html` for
+    pyinstrument. The profilers only see Python code of the current thread, so a JSON-file with
+    the same name records the durations of the stages of the conversion, including those running
+    in subprocesses like pandoc, its filter, the pandoc server and kaleido.
+
+    The JSON-file also records the CPU time of subprocesses, which finished during the
+    conversion, in `finished_subprocess_cpu_time`. It covers pandoc subprocesses and the python
+    filter, but neither the long-lived pandoc server nor kaleido, which keep running. It is
+    measured for the whole process, so it includes subprocesses of concurrent conversions.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        Directory of the profiles, it is created if it does not exist
+    name : str
+        Name of the notebook
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        Profiler, pyinstrument has to be installed separately
+    threshold : float, optional
+        Minimum duration of a conversion in seconds, faster conversions are not written
+    report : jupyter_docx_bundler.report.ConversionReport, optional
+        Report of the conversion, which is written next to the profile
+    logger : logging.Logger, optional
+        Logger of the paths of written profiles
+
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f'Unknown profiler: {profiler}')
+    profile = PROFILERS[profiler]()
+    cpu_before = _children_cpu_time()
+    start = time.perf_counter()
+    profile.start()
+    try:
+        yield
+    finally:
+        profile.stop()
+        duration = time.perf_counter() - start
+        if duration >= threshold:
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            timestamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            stem = f'{Path(name).name}-{timestamp}'
+            profile_path = directory / f'{stem}{profile.extension}'
+            profile.write(profile_path)
+
+            cpu_after = _children_cpu_time()
+            info = {
+                'notebook': name,
+                'duration': duration,
+                'profiler': profiler,
+                'profile': profile_path.name,
+                'finished_subprocess_cpu_time': {
+                    'user': cpu_after[0] - cpu_before[0],
+                    'system': cpu_after[1] - cpu_before[1],
+                } if cpu_before is not None else None,
+                'report': report.to_dict() if report is not None else None,
+            }
+            with open(directory / f'{stem}.json', 'w', encoding='utf8') as file:
+                json.dump(info, file, indent=2)
+            if logger is not None:
+                logger.info(
+                    f'Profile of the conversion of {name} in {duration:.3f} s written to '
+                    f'{profile_path}'
+                )
+
+
+def get_profile_dir(directory=None):
+    """Get the directory of profiles, by default from the environment variable
+
+    Parameters
+    ----------
+    directory : str, optional
+        Configured directory, which takes precedence over the environment variable
+
+    Returns
+    -------
+    str or None
+        Directory or None if conversions are not profiled
+
+    """
+    return directory or os.environ.get(PROFILE_DIR_ENV) or None
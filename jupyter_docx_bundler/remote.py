@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+
+from .cache import hash_key
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class RemoteImageError(OSError):
+    """Raised if a remote image can not be downloaded"""
+
+
+def get_session(pool_size=16):
+    """Get the HTTP session shared by all downloads of this process
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Number of connections per host which are kept open
+
+    Returns
+    -------
+    requests.Session
+
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def _cache_entry(value):
+    header, _, body = value.partition(b'\n')
+    return json.loads(header.decode('utf8')), body
+
+
+def fetch_image(url, timeout=30, max_size=100 * 1024 ** 2, cache=None, offline=False):
+    """Download a remote image
+
+    If a cache is given, a cached image is revalidated with a conditional request and only
+    downloaded again if it was modified.
+
+    Parameters
+    ----------
+    url : str
+        URL of the image
+    timeout : float, optional
+        Timeout for connecting to the server and for every read in seconds
+    max_size : int, optional
+        Maximum size of the image in bytes
+    cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of downloaded images
+    offline : bool, optional
+        Use only cached images without any requests
+
+    Returns
+    -------
+    bytes
+        Raw image data
+
+    """
+    import requests
+
+    key = hash_key('remote-image', url)
+    headers = {}
+    cached = None
+    if cache is not None:
+        value = cache.get(key)
+        if value is not None:
+            validators, cached = _cache_entry(value)
+            if offline:
+                return cached
+            if 'ETag' in validators:
+                headers['If-None-Match'] = validators['ETag']
+            if 'Last-Modified' in validators:
+                headers['If-Modified-Since'] = validators['Last-Modified']
+    if offline:
+        raise RemoteImageError(f'Image {url} is not cached and downloads are disabled')
+
+    try:
+        with get_session().get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304 and cached is not None:
+                return cached
+            r.raise_for_status()
+            if int(r.headers.get('Content-Length', 0)) > max_size:
+                raise RemoteImageError(f'Image {url} is larger than {max_size} bytes')
+            chunks = []
+            size = 0
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_size:
+                    raise RemoteImageError(f'Image {url} is larger than {max_size} bytes')
+                chunks.append(chunk)
+            validators = {
+                name: r.headers[name] for name in ('ETag', 'Last-Modified') if name in r.headers
+            }
+    except requests.RequestException as e:
+        raise RemoteImageError(f'Download of image {url} failed: {e}') from e
+    data = b''.join(chunks)
+
+    if cache is not None:
+        cache.set(key, json.dumps(validators).encode('utf8') + b'\n' + data)
+
+    return data
+
+
+def fetch_images(urls, workers=8, timeout=30, max_size=100 * 1024 ** 2, cache=None,
+                 offline=False):
+    """Download remote images concurrently
+
+    Parameters
+    ----------
+    urls : iterable of str
+        URLs of the images, every URL is only downloaded once
+    workers : int, optional
+        Maximum number of concurrent downloads
+    timeout : float, optional
+        Timeout for connecting to the server and for every read in seconds
+    max_size : int, optional
+        Maximum size of an image in bytes
+    cache : jupyter_docx_bundler.cache.DiskCache, optional
+        Cache of downloaded images
+    offline : bool, optional
+        Use only cached images without any requests
+
+    Returns
+    -------
+    dict
+        Raw image data or the `RemoteImageError` of a failed download with the URL as key
+
+    """
+    urls = list(dict.fromkeys(urls))
+    if len(urls) == 0:
+        return {}
+
+    def fetch(url):
+        try:
+            return fetch_image(
+                url, timeout=timeout, max_size=max_size, cache=cache, offline=offline,
+            )
+        except RemoteImageError as e:
+            return e
+
+    get_session(pool_size=max(workers, 16))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as executor:
+        return dict(zip(urls, executor.map(fetch, urls)))
@@ -0,0 +1,109 @@
+import contextlib
+import time
+
+
+class ConversionReport:
+    """Durations of the stages and cells of a conversion and counts of the converted content
+
+    Stages can be nested, the name of a nested stage is prefixed with the names of the enclosing
+    stages, e.g. `preprocess.tables`. A stage, which runs several times, accumulates its durations.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.cells = []
+        self._stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure the duration of a stage within the context
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage
+        """
+        self._stack.append(name)
+        name = '.'.join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            self._stack.pop()
+
+    def count(self, name, value=1):
+        """Add to a count of the converted content
+
+        Parameters
+        ----------
+        name : str
+            Name of the count
+        value : int, optional
+            Value, which is added
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_cell(self, index, cell_type, duration):
+        """Add the duration of a cell
+
+        Parameters
+        ----------
+        index : int
+            Index of the cell in the notebook
+        cell_type : str
+            Type of the cell
+        duration : float
+            Duration in seconds
+        """
+        self.cells.append({'index': index, 'cell_type': cell_type, 'duration': duration})
+
+    @property
+    def duration(self):
+        """Duration of all top-level stages in seconds"""
+        return sum(duration for name, duration in self.stages.items() if '.' not in name)
+
+    def to_dict(self):
+        """Get the report as a dict of plain values, which can be serialized to JSON
+
+        Returns
+        -------
+        dict
+
+        """
+        return {
+            'duration': self.duration,
+            'stages': dict(self.stages),
+            'counts': dict(self.counts),
+            'cells': [dict(cell) for cell in self.cells],
+        }
+
+    def summary(self):
+        """Describe the conversion in a single line
+
+        Returns
+        -------
+        str
+
+        """
+        stages = ', '.join(f'{name} {duration:.3f} s' for name, duration in self.stages.items())
+        counts = ', '.join(f'{name} {value}' for name, value in self.counts.items())
+        return f'Converted notebook in {self.duration:.3f} s ({stages})' + \
+            (f': {counts}' if counts else '')
+
+    def log(self, logger, slowest=5):
+        """Log the summary at info level and the slowest cells at debug level
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            Logger, e.g. the logger of a handler
+        slowest : int, optional
+            Number of cells, which are logged
+        """
+        logger.info(self.summary())
+        for cell in sorted(self.cells, key=lambda x: x['duration'], reverse=True)[:slowest]:
+            logger.debug(
+                f'Cell {cell["index"]} ({cell["cell_type"]}) took {cell["duration"]:.3f} s'
+            )
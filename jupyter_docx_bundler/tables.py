@@ -0,0 +1,375 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import io
+import re
+import threading
+
+from lxml import etree
+from tabulate import tabulate
+
+TABLE_SCHEMA_MIMETYPE = 'application/vnd.dataresource+json'
+
+# process pools by number of workers
+_pools = {}
+_pool_lock = threading.Lock()
+
+# names which pandas gives to unnamed index levels in a table schema
+RE_UNNAMED_INDEX = re.compile(r'\A(index|level_\d+)\Z')
+
+# dimensions at the end of the text of a dataframe
+RE_DIMENSIONS = re.compile(r'\[(\d+) rows x \d+ columns\]\s*\Z')
+
+
+def _format_datetimes(values, tz=None):
+    """Format ISO-timestamps of a table schema like pandas formats a datetime column"""
+    from datetime import datetime, timezone
+
+    timestamps = []
+    for value in values:
+        if value is None:
+            timestamps.append(None)
+            continue
+        timestamp = datetime.strptime(value[:23], '%Y-%m-%dT%H:%M:%S.%f')
+        if tz is not None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+            try:
+                from zoneinfo import ZoneInfo
+
+                timestamp = timestamp.astimezone(ZoneInfo(tz))
+            except (ImportError, KeyError):
+                pass
+        timestamps.append(timestamp)
+
+    valid = [x for x in timestamps if x is not None]
+    if tz is None and all(x.time() == datetime.min.time() for x in valid):
+        timespec = None
+    elif all(x.microsecond == 0 for x in valid):
+        timespec = 'seconds'
+    else:
+        timespec = 'milliseconds'
+    return [
+        'NaT' if x is None else
+        x.date().isoformat() if timespec is None else x.isoformat(sep=' ', timespec=timespec)
+        for x in timestamps
+    ]
+
+
+def table_schema_to_markdown(resource, nrows=None):
+    """Convert a table schema of a pandas-dataframe to a markdown pipe-table
+
+    The table schema is the `application/vnd.dataresource+json` output of a pandas-dataframe, if
+    the notebook was run with `pd.set_option('display.html.table_schema', True)`. Several index
+    levels are combined to a tuple, missing values and datetimes are formatted and truncated
+    tables end with a row of `...` like in `html_table_to_markdown`, so a dataframe looks the same
+    with and without the table schema.
+
+    Parameters
+    ----------
+    resource : dict
+        Table schema with the fields in `schema` and the rows in `data`
+    nrows : int, optional
+        Number of rows of the dataframe. pandas writes only the first `display.max_rows` rows to
+        the table schema, so the table is truncated if it has less rows.
+
+    Returns
+    -------
+    str
+
+    """
+    # keys of the rows are always strings in JSON, names of the fields not
+    fields = [f'{field["name"]}' for field in resource['schema']['fields']]
+    if 'primaryKey' in resource['schema']:
+        index = {f'{name}' for name in resource['schema']['primaryKey']}
+    else:
+        # pandas omits the primary key for non-unique indexes, unnamed levels are still first
+        index = set()
+        for name in fields:
+            if not RE_UNNAMED_INDEX.match(name):
+                break
+            index.add(name)
+
+    # values of every field, missing values like pandas shows them, missing numbers are left to
+    # tabulate, so their column stays numeric
+    values = {}
+    for field, name in zip(resource['schema']['fields'], fields):
+        column = [row.get(name) for row in resource['data']]
+        if field.get('type') == 'datetime':
+            column = _format_datetimes(column, tz=field.get('tz'))
+        elif field.get('type') not in ('number', 'integer'):
+            column = ['None' if x is None else x for x in column]
+        values[name] = column
+
+    if len(index) > 1:
+        index = [name for name in fields if name in index]
+        columns = [name for name in fields if name not in index]
+        headers = [''] + columns
+        columns = [[f'{tuple(x)}' for x in zip(*[values[name] for name in index])]] + \
+            [values[name] for name in columns]
+    else:
+        headers = [
+            '' if name in index and RE_UNNAMED_INDEX.match(name) else name for name in fields
+        ]
+        columns = [values[name] for name in fields]
+    rows = [list(row) for row in zip(*columns)]
+    if nrows is not None and nrows > len(rows):
+        rows.append(['...'] * len(headers))
+    return tabulate(rows, headers=headers, tablefmt='pipe', missingval='NaN')
+
+
+def _literal(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def pipe_table(headers, rows):
+    """Format text cells as a markdown pipe-table
+
+    Columns where all cells are numbers are aligned right, all others left. A table without
+    columns gives an empty string.
+
+    Parameters
+    ----------
+    headers : list of str
+        Header of every column
+    rows : list of list of str
+        Cells of every row
+
+    Returns
+    -------
+    str
+
+    """
+    if len(headers) == 0:
+        return ''
+    headers = [header.replace('|', '\\|') for header in headers]
+    rows = [[text.replace('|', '\\|') for text in row] for row in rows]
+    columns = list(zip(*rows)) if len(rows) > 0 else [()] * len(headers)
+    widths = [
+        max([len(header)] + [len(text) for text in column])
+        for header, column in zip(headers, columns)
+    ]
+    numeric = [
+        any(text != '' for text in column) and
+        all(text == '' or _is_number(text) for text in column)
+        for column in columns
+    ]
+
+    def line(cells):
+        return '| ' + ' | '.join(
+            text.rjust(width) if right else text.ljust(width)
+            for text, width, right in zip(cells, widths, numeric)
+        ) + ' |'
+
+    separator = '|' + '|'.join(
+        '-' * (width + 1) + ':' if right else ':' + '-' * (width + 1)
+        for width, right in zip(widths, numeric)
+    ) + '|'
+    return '\n'.join([line(headers), separator] + [line(row) for row in rows])
+
+
+def _expand_spans(rows):
+    """Expand cells spanning several rows or columns into a grid of (tag, text) cells"""
+    grid = []
+    # cells of previous rows spanning into the following rows by column
+    pending = {}
+    for cells in rows:
+        row = []
+        cells = iter(cells)
+        while True:
+            if len(row) in pending:
+                remaining, cell = pending[len(row)]
+                if remaining > 1:
+                    pending[len(row)] = (remaining - 1, cell)
+                else:
+                    del pending[len(row)]
+                row.append(cell)
+                continue
+            try:
+                tag, text, colspan, rowspan = next(cells)
+            except StopIteration:
+                break
+            for _ in range(colspan):
+                if rowspan > 1:
+                    pending[len(row)] = (rowspan - 1, (tag, text))
+                row.append((tag, text))
+        grid.append(row)
+    return grid
+
+
+def _span(cell, name):
+    try:
+        return max(1, int(cell.get(name, 1)))
+    except ValueError:
+        return 1
+
+
+def html_table_to_markdown(s):
+    """Convert the first HTML-table of a string to a markdown pipe-table without pandas
+
+    The HTML is parsed incrementally, so only a single row is held as element tree. Cells keep
+    the text of the HTML without any type conversion, so numbers are shown as in the notebook.
+    Columns with several header levels are labeled with the tuple of their headers and several
+    index levels are combined to a tuple, like in `pandas.DataFrame.to_markdown`.
+
+    Parameters
+    ----------
+    s : str
+        HTML-representation of the table, e.g. of a pandas-dataframe
+
+    Returns
+    -------
+    str
+
+    """
+    header_rows = []
+    body_rows = []
+    context = etree.iterparse(
+        io.BytesIO(s.encode('utf8')), events=('end',), tag=('tr', 'table'), html=True,
+    )
+    for _, element in context:
+        if element.tag == 'table':
+            break
+        cells = [
+            (cell.tag, ''.join(cell.itertext()).strip(), _span(cell, 'colspan'),
+             _span(cell, 'rowspan'))
+            for cell in element if cell.tag in ('th', 'td')
+        ]
+        if element.getparent() is not None and element.getparent().tag == 'thead':
+            header_rows.append(cells)
+        else:
+            body_rows.append(cells)
+        # free the parsed row and all preceding rows
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    else:
+        raise ValueError('No table found')
+
+    header = _expand_spans(header_rows)
+    body = _expand_spans(body_rows)
+
+    # cells of the index are header cells at the start of every row
+    nindex = 0
+    if len(body) > 0:
+        while nindex < len(body[0]) and body[0][nindex][0] == 'th':
+            nindex += 1
+    ncolumns = max([len(row) for row in header + body] + [0])
+
+    # pandas writes the names of the index in an additional header row without column labels
+    index_names = [''] * nindex
+    if nindex > 0 and len(header) > 0 and \
+            all(text == '' for _, text in header[-1][nindex:]) and \
+            any(text != '' for _, text in header[-1][:nindex]):
+        index_names = [text for _, text in header.pop()[:nindex]]
+
+    headers = [index_names[0] if nindex == 1 else ''] if nindex > 0 else []
+    for jj in range(nindex, ncolumns):
+        levels = [row[jj][1] if jj < len(row) else '' for row in header]
+        headers.append(levels[0] if len(levels) == 1 else f'{tuple(levels)}' if levels else '')
+
+    rows = []
+    for row in body:
+        texts = [text for _, text in row] + [''] * (ncolumns - len(row))
+        if nindex > 1:
+            index = [f'{tuple(_literal(text) for text in texts[:nindex])}']
+        else:
+            index = texts[:nindex]
+        rows.append(index + texts[nindex:])
+
+    return pipe_table(headers, rows)
+
+
+def _convert_table(table):
+    """Convert the table schema of a table or its HTML, if the table schema fails"""
+    error = None
+    if TABLE_SCHEMA_MIMETYPE in table:
+        try:
+            # the text of a truncated dataframe ends with its dimensions
+            match = RE_DIMENSIONS.search(table.get('text/plain', ''))
+            return table_schema_to_markdown(
+                table[TABLE_SCHEMA_MIMETYPE], nrows=int(match.group(1)) if match else None,
+            )
+        except Exception as e:
+            error = e
+    if 'text/html' in table:
+        try:
+            return html_table_to_markdown(table['text/html'])
+        except Exception as e:
+            error = e
+    return error
+
+
+def _shutdown_pool():
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+
+atexit.register(_shutdown_pool)
+
+
+def get_table_pool(workers):
+    """Get the process pool with a number of workers, which all table conversions share
+
+    Every number of workers gets its own pool, which is started on its first request and kept
+    until the process exits, so concurrent conversions never use a pool which is shut down.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes
+
+    Returns
+    -------
+    concurrent.futures.ProcessPoolExecutor
+
+    """
+    with _pool_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _pools[workers]
+
+
+def convert_tables(tables, workers=1):
+    """Convert several tables to markdown pipe-tables with a pool of worker processes
+
+    Parameters
+    ----------
+    tables : list of dict
+        Data of every table with its mimetypes as keys. The table schema is converted, if it is
+        available, and the HTML, if there is no table schema or its conversion fails. The
+        `text/plain` data tells, if the table schema is truncated.
+    workers : int, optional
+        Number of worker processes. With a single worker the tables are converted in the current
+        process.
+
+    Returns
+    -------
+    list
+        Markdown of every table or the exception of a failed conversion in the order of `tables`
+
+    """
+    if len(tables) == 0:
+        return []
+    workers = min(workers, len(tables))
+    if workers <= 1:
+        return [_convert_table(table) for table in tables]
+
+    return list(get_table_pool(workers).map(
+        _convert_table,
+        tables,
+        chunksize=max(1, len(tables) // (4 * workers)),
+    ))
@@ -1,6 +1,9 @@
+from functools import partial
+import http.server
 import os
 import re
 from pathlib import Path
+import threading
 
 import matplotlib.pyplot as plt
 from nbconvert.preprocessors import ExecutePreprocessor
@@ -23,6 +26,43 @@ def _random_matplotlib_image(path: Path):
     return path
 
 
+@pytest.fixture
+def http_server(tmpdir):
+    """Local HTTP server, which serves the files of a temporary directory"""
+    directory = Path(tmpdir) / 'http'
+    directory.mkdir()
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        requests = []
+        responses = []
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            Handler.requests.append(self.path)
+            super().do_GET()
+
+        def send_response(self, code, message=None):
+            Handler.responses.append((self.path, code))
+            super().send_response(code, message)
+
+    server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), partial(Handler, directory=f'{directory}'),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    server.directory = directory
+    server.requests = Handler.requests
+    server.responses = Handler.responses
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture(
     params=[
         'https://nbviewer.jupyter.org/github/unpingco/Python-for-Signal-Processing/blob/master/Mor'
@@ -0,0 +1,92 @@
+import os
+
+import mock
+import nbformat
+import pytest
+
+from .. import batch
+
+
+@pytest.fixture
+def notebook_files(tmpdir):
+    filenames = []
+    for ii in range(3):
+        nb = nbformat.v4.new_notebook()
+        nb.cells.append(nbformat.v4.new_markdown_cell(f'# Notebook {ii}'))
+        filename = tmpdir / 'notebooks' / f'notebook{ii}.ipynb'
+        os.makedirs(filename.dirname, exist_ok=True)
+        nbformat.write(nb, f'{filename}')
+        filenames.append(f'{filename}')
+
+    # add a broken notebook
+    filename = tmpdir / 'notebooks' / 'broken.ipynb'
+    with open(filename, 'w') as file:
+        file.write('no notebook')
+    filenames.append(f'{filename}')
+
+    return filenames
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_convert_notebooks(tmpdir, notebook_files, processes):
+    results = batch.convert_notebooks(
+        [f'{tmpdir / "notebooks" / "notebook*.ipynb"}', notebook_files[-1]],
+        output_dir=f'{tmpdir / "output"}',
+        processes=processes,
+    )
+
+    assert [result.notebook for result in results] == sorted(notebook_files[:-1]) + \
+        [notebook_files[-1]], 'Results are not in order of the notebooks.'
+    for result in results[:-1]:
+        assert result.success, result.error
+        with open(result.output, 'rb') as file:
+            assert file.read(2) == b'PK', 'Output is not a docx document.'
+    assert not results[-1].success
+    assert results[-1].error is not None
+
+
+def test_output_paths(tmpdir):
+    notebooks = [
+        f'{tmpdir / "reports" / "a" / "report.ipynb"}',
+        f'{tmpdir / "reports" / "c" / "report.ipynb"}',
+        f'{tmpdir / "reports" / "summary.ipynb"}',
+    ]
+    assert batch.output_paths(notebooks, output_dir=f'{tmpdir / "out"}') == [
+        f'{tmpdir / "out" / "a" / "report.docx"}',
+        f'{tmpdir / "out" / "c" / "report.docx"}',
+        f'{tmpdir / "out" / "summary.docx"}',
+    ]
+    assert batch.output_paths(notebooks[:1]) == [f'{tmpdir / "reports" / "a" / "report.docx"}']
+
+
+def test_main(tmpdir, notebook_files, capsys):
+    assert batch.main([
+        *notebook_files[:-1],
+        '--output-dir', f'{tmpdir / "output"}',
+        '--processes', '1',
+        '--DocxExporter.pandoc_io=file',
+    ]) == 0
+    assert batch._exporter.pandoc_io == 'file', 'Exporter configuration not applied.'
+    assert len(os.listdir(tmpdir / 'output')) == 3
+
+    assert batch.main([notebook_files[-1], '--processes', '1']) == 1
+    assert 'FAIL' in capsys.readouterr().out
+
+    assert batch.main([f'{tmpdir / "missing" / "*.ipynb"}']) == 1
+    assert 'No notebooks found' in capsys.readouterr().err
+
+
+def _crash(notebook, output):
+    os._exit(1)
+
+
+def test_broken_worker(tmpdir, notebook_files):
+    # a worker process, which is killed, breaks the pool
+    with mock.patch.object(batch, '_convert', _crash):
+        results = batch.convert_notebooks(
+            notebook_files[:2], output_dir=f'{tmpdir / "output"}', processes=2,
+        )
+    assert [result.notebook for result in results] == notebook_files[:2]
+    for result in results:
+        assert not result.success
+        assert result.error.startswith('BrokenProcessPool')
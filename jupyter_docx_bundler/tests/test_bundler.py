@@ -1,8 +1,14 @@
+import copy
 import os
+import subprocess
+import sys
 
+import mock
 from nbconvert import nbconvertapp
 import nbformat
 
+from .. import DocxExporter
+
 
 def test_jupyter_nbconvert_cli(tmpdir, download_notebook):
     ipynb_filename = os.path.join(tmpdir, 'download_notebook.ipynb')
@@ -12,3 +18,65 @@ def test_jupyter_nbconvert_cli(tmpdir, download_notebook):
     app = nbconvertapp.NbConvertApp()
     app.initialize(argv=[ipynb_filename, '--to', 'jupyter_docx_bundler.DocxExporter'])
     app.convert_notebooks()
+
+
+def test_lazy_imports():
+    # heavy dependencies are only imported by a conversion, which needs them
+    code = (
+        'import sys\n'
+        'import jupyter_docx_bundler\n'
+        'jupyter_docx_bundler.DocxExporter()\n'
+        'import jupyter_docx_bundler.converters\n'
+        'print(" ".join(name for name in ("pandas", "requests") if name in sys.modules))\n'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.join(os.path.dirname(__file__), '..', '..'),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    assert result.stdout.decode('utf8').strip() == ''
+
+
+def test_exporter_without_copy(tmpdir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('text'))
+    exporter = DocxExporter()
+
+    with mock.patch.object(copy, 'deepcopy', wraps=copy.deepcopy) as deepcopy:
+        exporter.from_notebook_node(nb, {'metadata': {'name': 'test', 'path': f'{tmpdir}'}})
+        deepcopy.assert_not_called()
+
+        # preprocessors of nbconvert change the notebook, so it is copied for them
+        exporter = DocxExporter(config={'ClearMetadataPreprocessor': {'enabled': True}})
+        exporter.from_notebook_node(nb, {'metadata': {'name': 'test', 'path': f'{tmpdir}'}})
+        deepcopy.assert_called()
+
+
+def test_exporter_function_preprocessor(tmpdir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('text'))
+
+    def preprocessor(nb, resources):
+        nb.cells[0].source = 'changed'
+        return nb, resources
+
+    # functions are always called by nbconvert, so the notebook is copied for them
+    preprocessor.enabled = False
+    exporter = DocxExporter()
+    exporter.register_preprocessor(preprocessor)
+    with mock.patch.object(copy, 'deepcopy', wraps=copy.deepcopy) as deepcopy:
+        exporter.from_notebook_node(nb, {'metadata': {'name': 'test', 'path': f'{tmpdir}'}})
+        deepcopy.assert_called()
+    assert nb.cells[0].source == 'text'
+
+
+def test_exporter_report(tmpdir):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('text'))
+
+    _, resources = DocxExporter().from_notebook_node(
+        nb, {'metadata': {'name': 'test', 'path': f'{tmpdir}'}},
+    )
+    assert resources['docx_report'].counts['cells'] == 1
+    assert resources['docx_report'].duration > 0
@@ -0,0 +1,56 @@
+import os
+import time
+
+from ..cache import DiskCache, get_memory_cache, hash_key, MemoryCache
+
+
+def test_hash_key():
+    assert hash_key('a', 'b') == hash_key('a', b'b')
+    assert hash_key('ab', 'c') != hash_key('a', 'bc'), 'Parts are not separated.'
+
+
+def test_disk_cache(tmpdir):
+    cache = DiskCache(tmpdir / 'cache')
+    key = hash_key('entry')
+
+    assert cache.get(key) is None
+    cache.set(key, b'content')
+    assert cache.get(key) == b'content'
+    assert DiskCache(tmpdir / 'cache').get(key) == b'content', 'Entry is not persistent.'
+
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_disk_cache_eviction(tmpdir):
+    cache = DiskCache(tmpdir, max_size=30)
+    keys = [hash_key(f'entry{ii}') for ii in range(3)]
+
+    for ii, key in enumerate(keys):
+        cache.set(key, b'x' * 10)
+        # make sure access times differ
+        os.utime(cache._path(key), (time.time() - 100 + ii, time.time() - 100 + ii))
+
+    # use first entry, so the second one is the least recently used
+    cache.get(keys[0])
+
+    cache.set(hash_key('entry3'), b'x' * 10)
+    assert cache.get(keys[1]) is None, 'Least recently used entry was not evicted.'
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_size=30)
+    keys = [hash_key(f'entry{ii}') for ii in range(4)]
+
+    for key in keys[:3]:
+        cache.set(key, b'x' * 10)
+    assert cache.get(keys[0]) == b'x' * 10
+
+    # least recently used entry is evicted
+    cache.set(keys[3], b'x' * 10)
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2], keys[3]))
+
+    assert get_memory_cache('test') is get_memory_cache('test'), 'Cache is not shared.'
@@ -1,12 +1,22 @@
+import base64
+import copy
 import json
+import os
 from pathlib import Path
 import re
 
+import mock
+
+import nbformat
 import numpy as np
 import pandas as pd
 import pypandoc
+import pytest
+from pytest_lazyfixture import lazy_fixture
 
 from .. import converters
+from ..cache import DiskCache, MemoryCache
+from ..report import ConversionReport
 
 
 def test_notebookcontent_to_docxbytes(test_notebook):
@@ -15,10 +25,14 @@ def test_notebookcontent_to_docxbytes(test_notebook):
     )
 
 
-def test_image_conversion(tmpdir, images_notebook):
+@pytest.mark.parametrize('pandoc_io', ['pipe', 'file'])
+def test_image_conversion(tmpdir, images_notebook, pandoc_io):
     # convert notebook to docx
     docxbytes = converters.notebookcontent_to_docxbytes(
-        images_notebook, 'test-notebook', images_notebook['metadata']['path'],
+        images_notebook,
+        'test-notebook',
+        images_notebook['metadata']['path'],
+        pandoc_io=pandoc_io,
     )
 
     # write to file on disk
@@ -41,10 +55,14 @@ def test_image_conversion(tmpdir, images_notebook):
         'Number of generated images does not match in docx-document.'
 
 
-def test_remove_input(tmpdir, remove_input_notebook):
+@pytest.mark.parametrize('pandoc_filter', ['lua', 'python'])
+def test_remove_input(tmpdir, remove_input_notebook, pandoc_filter):
     # convert notebook to docx
     docxbytes = converters.notebookcontent_to_docxbytes(
-        remove_input_notebook, 'test-notebook', remove_input_notebook['metadata']['path'],
+        remove_input_notebook,
+        'test-notebook',
+        remove_input_notebook['metadata']['path'],
+        pandoc_filter=pandoc_filter,
     )
 
     # write to file on disk
@@ -69,6 +87,41 @@ def test_remove_input(tmpdir, remove_input_notebook):
     assert len(re.findall('print(.*Hide my input!.*)', ''.join(lines))) == 0, 'Input not hided.'
 
 
+def test_pandoc_server_backend(tmpdir, remove_input_notebook):
+    remove_input_notebook['metadata']['title'] = 'Server title'
+
+    # convert notebook to docx
+    docxbytes = converters.notebookcontent_to_docxbytes(
+        remove_input_notebook,
+        'test-notebook',
+        remove_input_notebook['metadata']['path'],
+        pandoc_backend='server',
+    )
+
+    # write to file on disk
+    filename = tmpdir / 'server-notebook.docx'
+    outfilename = tmpdir / 'server-notebook.md'
+    with open(filename, 'wb') as file:
+        file.write(docxbytes)
+
+    # convert to markdown with metadata and read text
+    pypandoc.convert_file(
+        f'{filename}',
+        'markdown',
+        'docx',
+        extra_args=['--standalone'],
+        outputfile=f'{outfilename}',
+    )
+    with open(outfilename, 'r') as file:
+        lines = file.readlines()
+
+    assert 'Server title' in ''.join(lines), 'Metadata not applied.'
+    assert 'Hide my input!' in ''.join(lines), 'Output missing.'
+    assert len(re.findall('jupyter.*docx.*bundler.*remove.*input', ''.join(lines))) == 0, \
+        'Keyword not removed'
+    assert len(re.findall('print(.*Hide my input!.*)', ''.join(lines))) == 0, 'Input not hided.'
+
+
 def test_remove_cell(tmpdir, remove_cell_notebook):
     # convert notebook to docx
     docxbytes = converters.notebookcontent_to_docxbytes(
@@ -258,3 +311,245 @@ def test_ipython_output(tmpdir, ipython_output_notebook):
     lines = [line.replace('\n', '') for line in lines]
     assert len(lines) == 1
     assert re.search(ipython_output_notebook['metadata']['expected_pattern'], lines[0])
+
+
+def _display_output(data):
+    return nbformat.v4.new_output('display_data', data)
+
+
+def test_multiple_converted_outputs():
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        _display_output({'text/plain': 'first', 'text/markdown': '**first**'}),
+        _display_output({'text/plain': 'second', 'text/markdown': '**second**'}),
+        nbformat.v4.new_output('stream', text='kept'),
+        _display_output({'text/plain': 'third', 'text/latex': '$third$'}),
+    ]))
+    nb.cells.append(nbformat.v4.new_markdown_cell('next'))
+
+    nb = converters.preprocess(nb, '.')
+
+    assert [cell.cell_type for cell in nb.cells] == ['code'] + ['markdown'] * 4
+    assert [output.output_type for output in nb.cells[0].outputs] == ['stream']
+    assert [cell.source for cell in nb.cells[1:]] == ['**first**', '**second**', '$third$', 'next']
+
+
+def test_register_output_handler(monkeypatch):
+    monkeypatch.setattr(converters, 'OUTPUT_HANDLERS', list(converters.OUTPUT_HANDLERS))
+
+    @converters.register_output_handler('application/vnd.custom+json')
+    def custom_output(output, context):
+        if output['data']['application/vnd.custom+json'].get('skip'):
+            return None
+        return [nbformat.v4.new_markdown_cell(output['data']['text/plain'])]
+
+    # registered handlers take precedence over built-in handlers
+    converters.register_output_handler(
+        'text/markdown', lambda output, context: [nbformat.v4.new_markdown_cell('custom')],
+    )
+
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        _display_output({'application/vnd.custom+json': {}, 'text/plain': 'converted'}),
+        _display_output({'application/vnd.custom+json': {'skip': True}, 'text/plain': 'kept'}),
+        _display_output({'text/plain': 'markdown', 'text/markdown': 'markdown'}),
+    ]))
+
+    nb = converters.preprocess(nb, '.')
+
+    assert [output.data['text/plain'] for output in nb.cells[0].outputs] == ['kept']
+    assert [cell.source for cell in nb.cells[1:]] == ['converted', 'custom']
+
+
+def test_cell_cache(tmpdir):
+    cache = DiskCache(tmpdir / 'cache')
+    image = tmpdir / 'image.png'
+    image.write_binary(b'image')
+
+    def notebook(text):
+        nb = nbformat.v4.new_notebook()
+        nb.cells.append(nbformat.v4.new_markdown_cell(f'{text} $ x $'))
+        nb.cells.append(nbformat.v4.new_markdown_cell('![image](image.png)'))
+        nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+            _display_output({'text/plain': 'a', 'text/markdown': 'b'}),
+        ]))
+        for ii, cell in enumerate(nb.cells):
+            cell['id'] = f'cell-{ii}'
+        return nb
+
+    def cells(nb):
+        # ids of new cells are random
+        return [{k: v for k, v in cell.items() if k != 'id'} for cell in nb.cells]
+
+    expected = converters.preprocess(notebook('first'), f'{tmpdir}', deduplicate=False)
+    assert cells(converters.preprocess(
+        notebook('first'), f'{tmpdir}', deduplicate=False, cell_cache=cache,
+    )) == cells(expected)
+
+    # only changed cells are processed again
+    with mock.patch.object(
+            converters, 'linked_to_attachment_image', wraps=converters.linked_to_attachment_image,
+    ) as linked_to_attachment_image:
+        nb = converters.preprocess(
+            notebook('changed'), f'{tmpdir}', deduplicate=False, cell_cache=cache,
+        )
+        assert nb.cells[0].source == 'changed $x$'
+        assert cells(nb)[1:] == cells(expected)[1:]
+        assert linked_to_attachment_image.call_count == 1
+
+        # linked images invalidate their cell
+        image.write_binary(b'changed image')
+        os.utime(image, ns=(0, 0))
+        nb = converters.preprocess(
+            notebook('changed'), f'{tmpdir}', deduplicate=False, cell_cache=cache,
+        )
+        assert linked_to_attachment_image.call_count == 2
+        assert nb.cells[1].attachments != expected.cells[1].attachments
+
+
+def test_cell_cache_outputs(tmpdir):
+    cache = DiskCache(tmpdir / 'cache')
+    image = tmpdir / 'o.png'
+    image.write_binary(b'image')
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        _display_output({'text/plain': 'local', 'text/markdown': '![o](o.png)'}),
+    ]))
+    remote = nbformat.v4.new_code_cell(outputs=[
+        _display_output({'text/plain': 'remote', 'text/latex': '![r](http://127.0.0.1/r.png)'}),
+    ])
+
+    # images linked by outputs invalidate their cell, remote images are never cached
+    assert converters._cell_key(remote, f'{tmpdir}', '') is None
+    first = converters.preprocess(nb, f'{tmpdir}', deduplicate=False, cell_cache=cache)
+    image.write_binary(b'changed image')
+    os.utime(image, ns=(0, 0))
+    second = converters.preprocess(nb, f'{tmpdir}', deduplicate=False, cell_cache=cache)
+    assert first.cells[1].attachments != second.cells[1].attachments
+
+
+def test_cell_cache_failures(tmpdir):
+    cache = DiskCache(tmpdir / 'cache')
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        _display_output({'application/vnd.plotly.v1+json': {'data': [], 'layout': {}}}),
+    ]))
+
+    # cells of a failed conversion are not cached
+    with mock.patch.object(converters, 'render_plotly_figures') as render_plotly_figures:
+        render_plotly_figures.side_effect = ModuleNotFoundError('kaleido')
+        content = converters.preprocess(
+            nb, f'{tmpdir}', handler=mock.MagicMock(), cell_cache=cache,
+        )
+        assert 'image/png' not in content.cells[0].outputs[0]['data']
+
+        render_plotly_figures.side_effect = None
+        render_plotly_figures.return_value = [b'image']
+        content = converters.preprocess(nb, f'{tmpdir}', cell_cache=cache)
+    assert base64.b64decode(content.cells[0].outputs[0]['data']['image/png']) == b'image'
+
+
+def test_result_cache(tmpdir):
+    cache = MemoryCache()
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('text'))
+
+    docxbytes = converters.notebookcontent_to_docxbytes(
+        nbformat.from_dict(nb), 'test-notebook', f'{tmpdir}', result_cache=cache,
+    )
+    with mock.patch.object(converters, 'preprocess', wraps=converters.preprocess) as preprocess:
+        assert converters.notebookcontent_to_docxbytes(
+            nbformat.from_dict(nb), 'test-notebook', f'{tmpdir}', result_cache=cache,
+            plotly_workers=4,
+        ) == docxbytes
+        preprocess.assert_not_called()
+
+        # changed options and notebooks are converted again
+        converters.notebookcontent_to_docxbytes(
+            nbformat.from_dict(nb), 'test-notebook', f'{tmpdir}', result_cache=cache,
+            deduplicate=False,
+        )
+        nb['metadata']['title'] = 'title'
+        converters.notebookcontent_to_docxbytes(
+            nbformat.from_dict(nb), 'test-notebook', f'{tmpdir}', result_cache=cache,
+        )
+        assert preprocess.call_count == 2
+
+        # documents of conversions with failures are not cached
+        nb.cells.append(nbformat.v4.new_markdown_cell('![remote](http://127.0.0.1:1/r.png)'))
+        report = ConversionReport()
+        for _ in range(2):
+            converters.notebookcontent_to_docxbytes(
+                nbformat.from_dict(nb), 'test-notebook', f'{tmpdir}', handler=mock.MagicMock(),
+                result_cache=cache, report=report,
+            )
+        assert preprocess.call_count == 4
+        assert report.counts['failures'] == 2
+
+
+def test_result_key(tmpdir):
+    image = tmpdir / 'o.png'
+    image.write_binary(b'image')
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        _display_output({'text/plain': 'local', 'text/markdown': '![o](o.png)'}),
+    ]))
+    key = converters.result_key(nb, f'{tmpdir}')
+
+    # the notebook is hashed chunk by chunk, not as a single JSON document
+    with mock.patch.object(converters.json, 'dumps', wraps=json.dumps) as dumps:
+        assert converters.result_key(nb, f'{tmpdir}') == key
+    assert all(call.args[0] is not nb for call in dumps.call_args_list)
+
+    # images linked by outputs are part of the key
+    image.write_binary(b'changed image')
+    os.utime(image, ns=(0, 0))
+    assert converters.result_key(nb, f'{tmpdir}') != key
+
+
+def test_copy_notebook():
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell('plot()', outputs=[_display_output({
+        'image/png': 'iVBORw0KGgo=',
+    })]))
+    nb_copy = converters.copy_notebook(nb)
+
+    assert nb_copy == nb
+    assert nb_copy.cells[0].outputs[0].data is not nb.cells[0].outputs[0].data
+    assert nb_copy.cells[0].outputs[0].data['image/png'] is \
+        nb.cells[0].outputs[0].data['image/png']
+
+
+@pytest.mark.parametrize('nb', [
+    lazy_fixture('remove_input_notebook'),
+    lazy_fixture('remove_all_inputs_notebook'),
+    lazy_fixture('markdown_images_notebook'),
+    lazy_fixture('pandas_html_table_notebook'),
+])
+def test_preprocess_keeps_notebook(nb):
+    expected = copy.deepcopy(nb)
+    converters.preprocess(nb, nb['metadata']['path'], image_dpi=96)
+    assert nb == expected
+
+
+@pytest.mark.parametrize('pandoc_io', ['pipe', 'file'])
+def test_conversion_report(tmpdir, pandoc_io):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('$ x $'))
+    nb.cells.append(nbformat.v4.new_code_cell('df', outputs=[_display_output({
+        'text/plain': 'df',
+        'text/html': pd.DataFrame({'a': [1, 2]}).to_html(),
+    })]))
+    handler = mock.MagicMock()
+    report = ConversionReport()
+
+    converters.notebookcontent_to_docxbytes(
+        nb, 'test-notebook', f'{tmpdir}', handler=handler, pandoc_io=pandoc_io, report=report,
+    )
+
+    assert {'preprocess', 'preprocess.tables', 'preprocess.cells', 'pandoc'} <= set(report.stages)
+    assert report.counts['cells'] == 2
+    assert report.counts['tables'] == 1
+    assert report.counts['docx_bytes'] > 0
+    assert [cell['index'] for cell in report.cells] == [0, 1]
+    handler.log.info.assert_called_once_with(report.summary())
@@ -0,0 +1,62 @@
+import mock
+import pytest
+
+from .. import figures
+from ..cache import DiskCache
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+@pytest.fixture
+def plotly_figure():
+    return {
+        'data': [{'type': 'scatter', 'x': [0, 1, 2], 'y': [1, 3, 2]}],
+        'layout': {},
+    }
+
+
+def test_shared_plotly_scope(plotly_figure):
+    scope = figures.get_plotly_scope()
+    assert scope is figures.get_plotly_scope(), 'Scope is not shared.'
+
+    assert scope.transform(plotly_figure).startswith(PNG_SIGNATURE)
+    kaleido_scope = scope._scope
+    assert scope.transform(plotly_figure).startswith(PNG_SIGNATURE)
+    assert scope._scope is kaleido_scope, 'Kaleido was started again.'
+
+
+def test_plotly_scope_restart(plotly_figure):
+    scope = figures.ManagedPlotlyScope()
+    try:
+        scope.transform(plotly_figure)
+
+        # kill kaleido to simulate a crash
+        scope._scope._proc.kill()
+        scope._scope._proc.wait()
+
+        assert scope.transform(plotly_figure).startswith(PNG_SIGNATURE)
+    finally:
+        scope.shutdown()
+    assert scope._scope is None
+
+
+def test_render_plotly_figures_concurrently(plotly_figure):
+    widths = [300, 400, 500, 600, 700]
+    plotly_figures = [
+        dict(plotly_figure, layout={'width': width, 'height': 200}) for width in widths
+    ]
+
+    images = figures.render_plotly_figures(plotly_figures, scale=1.0, workers=2)
+
+    assert len(figures.get_plotly_scopes(2)) == 2
+    assert [int.from_bytes(image[16:20], 'big') for image in images] == widths, \
+        'Images are not in the order of the figures.'
+
+
+def test_render_plotly_figures_cache(tmpdir, plotly_figure):
+    cache = DiskCache(tmpdir)
+    image = figures.render_plotly_figures([plotly_figure], cache=cache)[0]
+
+    with mock.patch.object(figures, 'get_plotly_scopes') as get_plotly_scopes:
+        assert figures.render_plotly_figures([plotly_figure], cache=cache)[0] == image
+        get_plotly_scopes.assert_not_called()
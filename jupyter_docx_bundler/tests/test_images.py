@@ -0,0 +1,255 @@
+import base64
+from contextlib import nullcontext
+import io
+import zipfile
+
+import mock
+import nbformat
+from PIL import Image
+import pytest
+
+from .. import converters
+from .. import images
+from ..cache import DiskCache
+from ..images import (
+    deduplicate_images, downscale_image, encode_base64, resample_image, resample_images,
+)
+
+
+def _png(color, path=None):
+    image = Image.new('RGB', (10, 10), color)
+    if path is not None:
+        image.save(path)
+        return path
+    data = io.BytesIO()
+    image.save(data, 'png')
+    return base64.b64encode(data.getvalue()).decode('utf8')
+
+
+@pytest.fixture
+def duplicate_images_notebook(tmpdir):
+    nb = nbformat.v4.new_notebook()
+
+    # same linked image in several cells
+    filename = _png('red', tmpdir / 'linked.png')
+    for _ in range(3):
+        nb.cells.append(nbformat.v4.new_markdown_cell(f'![linked]({filename})'))
+
+    # same attachment with different names
+    for ii in range(3):
+        nb.cells.append(nbformat.v4.new_markdown_cell(f'![attachment](attachment:image{ii}.png)'))
+        nb.cells[-1]['attachments'] = {f'image{ii}.png': {'image/png': _png('green')}}
+
+    # different attachments with the same name
+    for color in ('blue', 'yellow'):
+        nb.cells.append(nbformat.v4.new_markdown_cell('![attachment](attachment:image.png)'))
+        nb.cells[-1]['attachments'] = {'image.png': {'image/png': _png(color)}}
+
+    nb['metadata'].update({
+        'path': f'{tmpdir}',
+        'image_count': 4,
+    })
+
+    return nb
+
+
+def test_deduplicate_images(duplicate_images_notebook):
+    nb = deduplicate_images(
+        converters.preprocess(
+            duplicate_images_notebook, duplicate_images_notebook['metadata']['path'],
+            deduplicate=False,
+        )
+    )
+
+    assert sum(len(cell.get('attachments', {})) for cell in nb.cells) == 4
+    for cell in nb.cells:
+        name = cell.source.split('attachment:')[1][:-1]
+        assert any(name in c.get('attachments', {}) for c in nb.cells), \
+            f'Attachment {name} is missing.'
+
+
+def test_deduplicated_images_in_docx(duplicate_images_notebook):
+    docxbytes = converters.notebookcontent_to_docxbytes(
+        duplicate_images_notebook,
+        'test-notebook',
+        duplicate_images_notebook['metadata']['path'],
+    )
+
+    with zipfile.ZipFile(io.BytesIO(docxbytes)) as docx:
+        media = [name for name in docx.namelist() if name.startswith('word/media/')]
+        colors = {Image.open(docx.open(name)).convert('RGB').getpixel((0, 0)) for name in media}
+    assert len(media) == duplicate_images_notebook['metadata']['image_count']
+    assert len(colors) == 4, 'Images with the same name are mixed up.'
+
+
+def test_encode_base64(tmpdir, monkeypatch):
+    monkeypatch.setattr(images, 'CHUNK_SIZE', 3 * 5)
+    data = bytes(range(256)) * 3
+    filename = tmpdir / 'data.bin'
+    filename.write_binary(data)
+
+    expected = base64.b64encode(data).decode('ascii')
+    assert encode_base64(data) == expected
+    assert encode_base64(f'{filename}') == expected
+
+
+@pytest.fixture
+def large_image_notebook(tmpdir):
+    filename = tmpdir / 'large image.png'
+    Image.effect_noise((400, 300), 64).convert('RGB').save(filename)
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('text ![large image](large image.png) text'))
+    nb['metadata'].update({
+        'path': f'{tmpdir}',
+        'size': filename.size(),
+    })
+    return nb
+
+
+def test_downscale_image(large_image_notebook):
+    filename = f'{large_image_notebook["metadata"]["path"]}/large image.png'
+    max_size = large_image_notebook['metadata']['size'] // 4
+    data, format = downscale_image(filename, max_size)
+
+    assert format == 'png'
+    assert len(data) <= max_size
+    assert Image.open(io.BytesIO(data)).width < Image.open(filename).width
+
+
+@pytest.mark.parametrize('size_action', ['warn', 'skip', 'downscale'])
+def test_image_max_size(large_image_notebook, size_action):
+    max_size = large_image_notebook['metadata']['size'] // 4
+    with pytest.warns(UserWarning) if size_action != 'downscale' else nullcontext():
+        nb = converters.preprocess(
+            large_image_notebook,
+            large_image_notebook['metadata']['path'],
+            image_max_size=max_size,
+            image_size_action=size_action,
+        )
+
+    cell = nb.cells[0]
+    if size_action == 'skip':
+        assert cell.source == 'text large image text'
+        assert not cell.get('attachments')
+    else:
+        data = base64.b64decode(next(iter(cell.attachments.values()))['image/png'])
+        assert (len(data) <= max_size) == (size_action == 'downscale')
+
+
+def test_link_local_images(large_image_notebook):
+    nb = converters.preprocess(
+        nbformat.from_dict(large_image_notebook),
+        large_image_notebook['metadata']['path'],
+        link_local_images=True,
+    )
+    assert 'attachments' not in nb.cells[0]
+
+    docxbytes = converters.notebookcontent_to_docxbytes(
+        large_image_notebook,
+        'test-notebook',
+        large_image_notebook['metadata']['path'],
+        link_local_images=True,
+    )
+    with zipfile.ZipFile(io.BytesIO(docxbytes)) as docx:
+        media = [name for name in docx.namelist() if name.startswith('word/media/')]
+    assert len(media) == 1
+
+
+def _image_bytes(size, mode='RGB', format='png', **kwargs):
+    data = io.BytesIO()
+    Image.new(mode, size, 'red').save(data, format, **kwargs)
+    return data.getvalue()
+
+
+def test_resample_image():
+    data, format = resample_image(_image_bytes((1000, 500)), 300, dpi=150)
+    with Image.open(io.BytesIO(data)) as img:
+        assert format == 'png'
+        assert img.size == (300, 150)
+        assert round(img.info['dpi'][0]) == 150
+
+    # small images are not enlarged
+    data = _image_bytes((100, 50), dpi=(72, 72))
+    resampled, _ = resample_image(data, 300, dpi=150)
+    with Image.open(io.BytesIO(resampled)) as img:
+        assert img.size == (100, 50)
+        assert round(img.info['dpi'][0]) == 72
+
+    # transparent images are flattened for jpeg
+    data, format = resample_image(_image_bytes((100, 50), mode='RGBA'), 300, format='jpeg')
+    with Image.open(io.BytesIO(data)) as img:
+        assert format == 'jpeg'
+        assert img.mode == 'RGB'
+
+
+def test_resample_images_cache(tmpdir):
+    cache = DiskCache(tmpdir / 'cache')
+    data = [_image_bytes((1000, 500)), _image_bytes((500, 1000))]
+
+    results = resample_images(data, 300, workers=2, cache=cache)
+    assert [Image.open(io.BytesIO(x)).size for x, _ in results] == [(300, 150), (300, 600)]
+
+    with mock.patch.object(images, 'resample_image') as mock_resample_image:
+        assert resample_images(data, 300, workers=2, cache=cache) == results
+    mock_resample_image.assert_not_called()
+
+
+def test_resample_notebook_images():
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('![attachment](attachment:image.png)'))
+    nb.cells[-1]['attachments'] = {
+        'image.png': {'image/png': base64.b64encode(_image_bytes((2000, 1000))).decode('ascii')},
+    }
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        nbformat.v4.new_output(
+            'display_data',
+            {'image/png': base64.b64encode(_image_bytes((3000, 1000))).decode('ascii')},
+        ),
+    ]))
+
+    converters.resample_notebook_images(nb, width=5, dpi=100, format='jpeg')
+
+    assert nb.cells[0].source == '![attachment](attachment:image.jpeg)'
+    data = base64.b64decode(nb.cells[0].attachments['image.jpeg']['image/jpeg'])
+    assert Image.open(io.BytesIO(data)).size == (500, 250)
+    data = base64.b64decode(nb.cells[1].outputs[0]['data']['image/jpeg'])
+    assert 'image/png' not in nb.cells[1].outputs[0]['data']
+    assert Image.open(io.BytesIO(data)).size == (500, 167)
+
+
+def test_resample_linked_images(tmpdir):
+    # same image linked by cells with attachments and a photo with extension jpg
+    (tmpdir / 'linked.png').write_binary(_image_bytes((2000, 1000)))
+    (tmpdir / 'photo.jpg').write_binary(_image_bytes((3000, 2000), format='jpeg'))
+    nb = nbformat.v4.new_notebook()
+    for ii in range(2):
+        nb.cells.append(nbformat.v4.new_markdown_cell(
+            f'![attachment](attachment:image{ii}.png)\n![linked](linked.png)',
+        ))
+        nb.cells[-1]['attachments'] = {f'image{ii}.png': {'image/png': _png('green')}}
+    nb.cells.append(nbformat.v4.new_markdown_cell('![photo](photo.jpg)'))
+
+    nb = converters.preprocess(
+        nb, f'{tmpdir}', deduplicate=False, image_dpi=100, image_format='jpeg',
+    )
+
+    for cell in nb.cells[:2]:
+        data = base64.b64decode(cell.attachments['linked.jpeg']['image/jpeg'])
+        assert Image.open(io.BytesIO(data)).size == (650, 325)
+    data = base64.b64decode(nb.cells[2].attachments['photo.jpg']['image/jpeg'])
+    assert Image.open(io.BytesIO(data)).size == (650, 433)
+
+
+@pytest.mark.parametrize('image_dpi,scale', [(None, 2.0), (192, 2.0), (300, 3.125)])
+def test_plotly_scale_follows_image_dpi(image_dpi, scale):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        nbformat.v4.new_output(
+            'display_data', {'application/vnd.plotly.v1+json': {'data': [], 'layout': {}}},
+        ),
+    ]))
+
+    with mock.patch.object(converters, 'render_plotly_figures') as render_plotly_figures:
+        render_plotly_figures.return_value = [_image_bytes((10, 10))]
+        converters.preprocess(nb, '.', image_dpi=image_dpi)
+    assert render_plotly_figures.call_args.kwargs['scale'] == scale
@@ -0,0 +1,24 @@
+import pytest
+
+from ..math_delimiters import normalize_math
+
+
+@pytest.mark.parametrize('source,expected', [
+    (r'Inline formular $ y = m \cdot x + b $', r'Inline formular $y = m \cdot x + b$'),
+    (r'$$ y = m \cdot x + b $$', r'$$y = m \cdot x + b$$'),
+    ('$ a $ and $ b $', '$a$ and $b$'),
+    ('$$\n  x = 1\n$$ and $ z $', '$$x = 1$$ and $z$'),
+    ('costs $5 and $10 each', 'costs $5 and $10 each'),
+    ('cost $5 and $ y $', 'cost $5 and $y$'),
+    ('$ x $ costs $5', '$x$ costs $5'),
+    ('from $5 to $10 with $ a $ and $ b $', 'from $5 to $10 with $a$ and $b$'),
+    ('$ 5 + x $ for $3', '$5 + x$ for $3'),
+    (r'escaped \$ x $ a $', r'escaped \$ x $a$'),
+    ('`$ code $` and $ x $', '`$ code $` and $x$'),
+    ('```\n$ x $\n```\n$ y $', '```\n$ x $\n```\n$y$'),
+    ('unclosed ` and $ x $', 'unclosed ` and $x$'),
+    ('line $ a\nb $', 'line $ a\nb $'),
+    ('no math', 'no math'),
+])
+def test_normalize_math(source, expected):
+    assert normalize_math(source) == expected
@@ -0,0 +1,35 @@
+import pytest
+
+from ..pandoc_server import PandocServer, PandocServerError
+
+
+@pytest.fixture
+def pandoc_server():
+    server = PandocServer()
+    yield server
+    server.shutdown()
+
+
+def test_pandoc_server_convert(pandoc_server):
+    html = pandoc_server.convert('# Heading', 'markdown', 'html')
+    assert b'<h1' in html
+
+    docx = pandoc_server.convert('# Heading', 'markdown', 'docx', metadata={'title': 'Title'})
+    assert docx.startswith(b'PK'), 'Output is not a docx document.'
+
+
+def test_pandoc_server_restart(pandoc_server):
+    pandoc_server.convert('text', 'markdown', 'html')
+    proc = pandoc_server._proc
+
+    # kill server to simulate a crash
+    proc.kill()
+    proc.wait()
+
+    assert b'text' in pandoc_server.convert('text', 'markdown', 'html')
+    assert pandoc_server._proc is not proc, 'Server was not restarted.'
+
+
+def test_pandoc_server_error(pandoc_server):
+    with pytest.raises(PandocServerError):
+        pandoc_server.convert('text', 'markdown', 'unknown-format')
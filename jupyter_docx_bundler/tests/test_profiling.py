@@ -0,0 +1,62 @@
+import json
+import pstats
+import time
+
+import mock
+import nbformat
+import pytest
+
+from .. import DocxExporter
+from ..profiling import get_profile_dir, PROFILE_DIR_ENV, profile_conversion
+from ..report import ConversionReport
+
+
+def test_profile_conversion(tmpdir):
+    report = ConversionReport()
+    logger = mock.MagicMock()
+    with profile_conversion(tmpdir / 'profiles', 'my.notebook', report=report, logger=logger):
+        with report.stage('pandoc'):
+            time.sleep(0.01)
+
+    profiles = (tmpdir / 'profiles').listdir()
+    assert sorted(x.ext for x in profiles) == ['.json', '.prof']
+    for profile in profiles:
+        assert profile.basename.startswith('my.notebook-')
+    info = json.loads([x for x in profiles if x.ext == '.json'][0].read_text('utf8'))
+    assert info['notebook'] == 'my.notebook'
+    assert info['report']['stages']['pandoc'] >= 0.01
+    assert set(info['finished_subprocess_cpu_time']) == {'user', 'system'}
+    pstats.Stats(f'{[x for x in profiles if x.ext == ".prof"][0]}')
+    logger.info.assert_called_once()
+
+
+def test_profile_threshold(tmpdir):
+    with profile_conversion(tmpdir, 'notebook', threshold=60.0):
+        pass
+    assert tmpdir.listdir() == []
+
+
+def test_pyinstrument_profile(tmpdir):
+    pytest.importorskip('pyinstrument')
+    with profile_conversion(tmpdir, 'notebook', profiler='pyinstrument'):
+        pass
+    assert sorted(x.ext for x in tmpdir.listdir()) == ['.html', '.json']
+
+
+def test_exporter_profile(tmpdir, monkeypatch):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_markdown_cell('text'))
+    resources = {'metadata': {'name': 'test', 'path': f'{tmpdir}'}}
+
+    monkeypatch.delenv(PROFILE_DIR_ENV, raising=False)
+    assert get_profile_dir() is None
+    DocxExporter().from_notebook_node(nb, resources)
+
+    monkeypatch.setenv(PROFILE_DIR_ENV, f'{tmpdir / "env"}')
+    DocxExporter().from_notebook_node(nb, resources)
+    assert len((tmpdir / 'env').listdir()) == 2
+
+    DocxExporter(config={'DocxExporter': {'profile_dir': f'{tmpdir / "config"}'}}) \
+        .from_notebook_node(nb, resources)
+    assert len((tmpdir / 'config').listdir()) == 2
+    assert len((tmpdir / 'env').listdir()) == 2
@@ -0,0 +1,110 @@
+import base64
+import os
+import time
+
+import nbformat
+import pytest
+
+from .. import converters
+from ..cache import DiskCache
+from ..remote import fetch_image, fetch_images, RemoteImageError
+
+
+@pytest.fixture
+def remote_images(http_server):
+    images = {}
+    for ii in range(5):
+        data = bytes([ii]) * 1000
+        (http_server.directory / f'image{ii}.png').write_bytes(data)
+        images[f'{http_server.url}/image{ii}.png'] = data
+    return images
+
+
+def test_fetch_images(http_server, remote_images):
+    urls = list(remote_images) + list(remote_images)
+    assert fetch_images(urls, workers=4) == remote_images
+    assert len(http_server.requests) == len(remote_images), 'Images downloaded more than once.'
+
+
+def test_fetch_image_errors(http_server, remote_images):
+    with pytest.raises(RemoteImageError):
+        fetch_image(f'{http_server.url}/missing.png')
+    with pytest.raises(RemoteImageError):
+        fetch_image(list(remote_images)[0], max_size=100)
+
+    images = fetch_images([f'{http_server.url}/missing.png'])
+    assert isinstance(images[f'{http_server.url}/missing.png'], RemoteImageError)
+
+
+def test_linked_remote_images(tmpdir, http_server, remote_images):
+    urls = list(remote_images)
+    cell = nbformat.v4.new_markdown_cell('\n'.join([
+        'line1',
+        f'![first]({urls[0]})',
+        'line3',
+        f'![second]({urls[1]})',
+        'line5',
+    ]))
+    nb = nbformat.v4.new_notebook(cells=[cell])
+
+    content = converters.preprocess(nb, f'{tmpdir}', deduplicate=False)
+    assert content.cells[0].source == '\n'.join([
+        'line1',
+        '![first](attachment:image0.png)',
+        'line3',
+        '![second](attachment:image1.png)',
+        'line5',
+    ])
+    assert base64.b64decode(content.cells[0].attachments['image1.png']['image/png']) == \
+        remote_images[urls[1]]
+
+
+def test_fetch_image_cache(tmpdir, http_server, remote_images):
+    cache = DiskCache(tmpdir / 'cache')
+    url = list(remote_images)[0]
+    path = http_server.directory / 'image0.png'
+
+    # set modification time to the past, because it has a resolution of one second
+    os.utime(path, (time.time() - 10, time.time() - 10))
+    assert fetch_image(url, cache=cache) == remote_images[url]
+    assert fetch_image(url, cache=cache) == remote_images[url]
+    assert http_server.responses == [('/image0.png', 200), ('/image0.png', 304)], \
+        'Cached image was not revalidated.'
+
+    # modify image
+    path.write_bytes(b'modified')
+    assert fetch_image(url, cache=cache) == b'modified'
+
+
+def test_fetch_image_offline(tmpdir, http_server, remote_images):
+    cache = DiskCache(tmpdir / 'cache')
+    urls = list(remote_images)
+
+    fetch_image(urls[0], cache=cache)
+    assert fetch_image(urls[0], cache=cache, offline=True) == remote_images[urls[0]]
+    with pytest.raises(RemoteImageError):
+        fetch_image(urls[1], cache=cache, offline=True)
+    assert len(http_server.requests) == 1
+
+
+def test_remote_images_of_outputs(tmpdir, http_server, remote_images):
+    cache = DiskCache(tmpdir / 'cache')
+    urls = list(remote_images)
+    fetch_image(urls[0], cache=cache)
+    output = nbformat.v4.new_output('display_data', data={
+        'text/plain': 'images',
+        'text/markdown': f'![first]({urls[0]})\n![second]({urls[1]})',
+    })
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell(outputs=[output])])
+
+    # images of outputs are fetched with the options of the other remote images
+    with pytest.raises(RemoteImageError):
+        converters.preprocess(
+            nb, f'{tmpdir}', remote_image_cache=cache, remote_image_offline=True,
+        )
+    assert len(http_server.requests) == 1
+
+    content = converters.preprocess(nb, f'{tmpdir}', deduplicate=False, remote_image_workers=2)
+    assert content.cells[1].source == \
+        '![first](attachment:image0.png)\n![second](attachment:image1.png)'
+    assert len(http_server.requests) == 3
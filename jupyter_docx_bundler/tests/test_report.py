@@ -0,0 +1,32 @@
+import json
+
+import mock
+
+from ..report import ConversionReport
+
+
+def test_conversion_report():
+    report = ConversionReport()
+    with report.stage('preprocess'):
+        with report.stage('tables'):
+            pass
+        with report.stage('tables'):
+            pass
+    with report.stage('pandoc'):
+        pass
+    report.count('tables')
+    report.count('tables', 2)
+    report.add_cell(3, 'code', 0.5)
+
+    assert list(report.stages) == ['preprocess.tables', 'preprocess', 'pandoc']
+    assert report.duration == report.stages['preprocess'] + report.stages['pandoc']
+    assert report.counts == {'tables': 3}
+    assert json.loads(json.dumps(report.to_dict()))['cells'] == [
+        {'index': 3, 'cell_type': 'code', 'duration': 0.5},
+    ]
+    assert 'tables 3' in report.summary()
+
+    logger = mock.MagicMock()
+    report.log(logger)
+    logger.info.assert_called_once_with(report.summary())
+    logger.debug.assert_called_once_with('Cell 3 (code) took 0.500 s')
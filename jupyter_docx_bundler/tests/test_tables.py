@@ -0,0 +1,205 @@
+import json
+
+import mock
+import nbformat
+import numpy as np
+import pandas as pd
+import pytest
+
+from .. import converters, tables
+from ..converters import html_to_pandas_table
+from ..tables import (
+    convert_tables, html_table_to_markdown, pipe_table, TABLE_SCHEMA_MIMETYPE,
+    table_schema_to_markdown,
+)
+
+
+@pytest.fixture(
+    params=[
+        'normal',
+        'named-index',
+        'non-unique-index',
+        'multirow',
+    ],
+)
+def table_schema_dataframe(request):
+    if request.param == 'named-index':
+        index = pd.Index(np.arange(6), name='myindex')
+        df = pd.DataFrame(np.random.randn(6, 4), index=index, columns=list('ABCD'))
+    elif request.param == 'non-unique-index':
+        df = pd.DataFrame(np.random.randn(6, 4), index=[0, 0, 1, 1, 2, 2], columns=list('ABCD'))
+    elif request.param == 'multirow':
+        index = pd.MultiIndex.from_product([['A', 'B', 'C'], [1, 2]], names=['first', 'second'])
+        df = pd.DataFrame(np.random.randn(6, 4), index=index)
+    else:
+        df = pd.DataFrame(np.random.randn(6, 4), columns=list('ABCD'))
+    # the table schema of pandas keeps only 10 decimals
+    return df.round(8)
+
+
+def _table_schema(df):
+    # round trip through JSON like in a notebook file
+    with pd.option_context('display.html.table_schema', True):
+        return json.loads(json.dumps(df._repr_data_resource_()))
+
+
+def test_table_schema_to_markdown(table_schema_dataframe):
+    markdown = table_schema_to_markdown(_table_schema(table_schema_dataframe))
+
+    # several levels of the index are combined to a tuple
+    assert markdown == table_schema_dataframe.to_markdown()
+
+
+def test_table_schema_output(table_schema_dataframe):
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        nbformat.v4.new_output('execute_result', {
+            'text/plain': repr(table_schema_dataframe),
+            'text/html': table_schema_dataframe._repr_html_(),
+            TABLE_SCHEMA_MIMETYPE: _table_schema(table_schema_dataframe),
+        }, execution_count=1),
+    ]))
+
+    with mock.patch.object(tables, 'html_table_to_markdown') as html_table_to_markdown:
+        nb = converters.preprocess(nb, '.')
+    html_table_to_markdown.assert_not_called()
+
+    assert len(nb.cells) == 2
+    assert len(nb.cells[0].outputs) == 0
+    assert nb.cells[1].cell_type == 'markdown'
+    assert nb.cells[1].source.count('\n') == table_schema_dataframe.shape[0] + 1
+
+
+@pytest.mark.parametrize('max_rows', [60, 2])
+def test_table_schema_like_html(max_rows):
+    df = pd.DataFrame({
+        'date': pd.to_datetime(['2020-01-01', '2020-01-02', None]),
+        'time': pd.to_datetime(['2020-01-01 10:00:00', '2020-01-02 11:30:15', None]),
+        'value': [1.5, np.nan, 3.5],
+        'text': ['a', None, 'b'],
+    })
+    with pd.option_context('display.html.table_schema', True, 'display.max_rows', max_rows):
+        table = {
+            TABLE_SCHEMA_MIMETYPE: _table_schema(df),
+            'text/plain': repr(df),
+        }
+        html = df._repr_html_()
+
+    cells = _cells(tables._convert_table(table))
+    expected = _cells(html_table_to_markdown(html))
+    assert cells[:2] == expected[:2]
+    if max_rows < len(df):
+        # pandas writes only the first rows to the table schema
+        assert cells[-1] == ['...'] * 5
+    else:
+        assert cells == expected
+
+
+def _cells(markdown):
+    lines = markdown.split('\n')
+    return [[x.strip() for x in line.strip('|').split('|')] for line in lines[:1] + lines[2:]]
+
+
+@pytest.mark.parametrize('columns', [list('ABCD'), [list('1122'), list('ABCD')]])
+@pytest.mark.parametrize('index', [
+    None,
+    pd.Index(np.arange(6), name='myindex'),
+    pd.MultiIndex.from_product([['A', 'B', 'C'], [1, 2]], names=['first', 'second']),
+])
+def test_html_table_to_markdown(index, columns):
+    df = pd.DataFrame(np.random.randn(6, 4), index=index, columns=columns)
+    html = df._repr_html_()
+
+    # same table as the conversion with pandas, except the formatting of numbers
+    expected = _cells(html_to_pandas_table(html).to_markdown())
+    cells = _cells(html_table_to_markdown(html))
+    assert cells[0] == expected[0], 'Header does not match'
+    assert [row[0] for row in cells] == [row[0] for row in expected], 'Index does not match'
+    np.testing.assert_allclose(
+        np.array([row[1:] for row in cells[1:]], dtype=float),
+        np.array([row[1:] for row in expected[1:]], dtype=float),
+        atol=1e-5,
+    )
+
+
+def test_pipe_table():
+    assert pipe_table(['', 'a', 'b'], [['0', 'x', '1.5'], ['1', 'y|z', 'NaN']]) == '\n'.join([
+        '|   | a    |   b |',
+        '|--:|:-----|----:|',
+        '| 0 | x    | 1.5 |',
+        '| 1 | y\\|z | NaN |',
+    ])
+
+
+def test_empty_table():
+    assert pipe_table([], []) == ''
+    assert html_table_to_markdown('<table></table>') == ''
+
+
+def test_table_pools():
+    pool = tables.get_table_pool(2)
+    assert tables.get_table_pool(2) is pool
+    # pools of other numbers of workers keep running pools usable
+    tables.get_table_pool(3)
+    assert pool.submit(abs, -1).result() == 1
+
+
+def test_convert_tables():
+    dfs = [pd.DataFrame(np.random.randn(ii + 1, 3)) for ii in range(6)]
+    tables = [{'text/html': df._repr_html_()} for df in dfs[:3]] + \
+        [{TABLE_SCHEMA_MIMETYPE: _table_schema(df)} for df in dfs[3:]] + \
+        [{'text/html': '<!-- <table> -->'}]
+
+    expected = convert_tables(tables)
+    assert isinstance(expected[-1], ValueError)
+    assert [x.count('\n') for x in expected[:-1]] == [ii + 2 for ii in range(6)]
+
+    results = convert_tables(tables, workers=2)
+    assert results[:-1] == expected[:-1], 'Tables are mixed up.'
+    assert isinstance(results[-1], ValueError)
+
+
+def test_table_conversion_error():
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        nbformat.v4.new_output('execute_result', {
+            'text/plain': 'table',
+            'text/html': '<!-- <table> -->',
+        }, execution_count=1),
+    ]))
+
+    with pytest.raises(ValueError):
+        converters.preprocess(nbformat.from_dict(nb), '.', table_workers=2)
+
+    handler = mock.MagicMock()
+    converters.preprocess(nb, '.', handler=handler, table_workers=2)
+    handler.log.warning.assert_called_once_with(
+        'Conversion of pandas HTML-table failed : No table found',
+    )
+
+    # failed tables with a table schema are reported only once too
+    nb.cells[0].outputs[0]['data'][TABLE_SCHEMA_MIMETYPE] = {'data': []}
+    handler = mock.MagicMock()
+    converters.preprocess(nb, '.', handler=handler)
+    handler.log.warning.assert_called_once_with(
+        'Conversion of pandas HTML-table failed : No table found',
+    )
+
+
+def test_table_schema_fallback():
+    df = pd.DataFrame(np.arange(6).reshape(3, 2), columns=list('AB'))
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell(outputs=[
+        nbformat.v4.new_output('execute_result', {
+            'text/plain': repr(df),
+            'text/html': df._repr_html_(),
+            TABLE_SCHEMA_MIMETYPE: {'data': []},
+        }, execution_count=1),
+    ]))
+
+    # the HTML is converted, if the table schema fails
+    handler = mock.MagicMock()
+    nb = converters.preprocess(nb, '.', handler=handler)
+    handler.log.warning.assert_not_called()
+    assert len(nb.cells[0].outputs) == 0
+    assert nb.cells[1].source == html_table_to_markdown(df._repr_html_())